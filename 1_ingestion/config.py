@@ -10,21 +10,22 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # --- Source Document Paths ---
 # Raw PDFs are expected to be placed here
 PDF_SOURCE_DIR = BASE_DIR / "1_ingestion/source_documents/pdfs"
-# Intermediate directory for cleaned Markdown files
+# Cleaned Markdown copies, written only when KEEP_CLEANED_MD is enabled
 MD_CLEANED_DIR = BASE_DIR / "1_ingestion/source_documents/cleaned_md"
-# Directory for PDFs that fail processing
+# Directory for PDFs that fail processing (plus their TEI/XML if conversion failed)
 QUARANTINED_DIR = BASE_DIR / "1_ingestion/source_documents/quarantined"
 # Final processed JSON files for the database
 PROCESSED_DATA_DIR = BASE_DIR / "1_ingestion/processed_data"
-# Temporary directory for GROBID's raw XML output
-XML_OUTPUT_DIR = BASE_DIR / "1_ingestion/source_documents/xml_output"
+# SHA-256 digests of every successfully ingested PDF, used to skip duplicates
+# saved under a different filename. Kept outside PROCESSED_DATA_DIR so the
+# database builder doesn't mistake it for a processed document.
+PROCESSED_HASHES_FILE = BASE_DIR / "1_ingestion/processed_hashes.json"
 
 # --- Create Directories if they don't exist ---
 PDF_SOURCE_DIR.mkdir(parents=True, exist_ok=True)
 MD_CLEANED_DIR.mkdir(parents=True, exist_ok=True)
 QUARANTINED_DIR.mkdir(parents=True, exist_ok=True)
 PROCESSED_DATA_DIR.mkdir(parents=True, exist_ok=True)
-XML_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 
 
 # --- GROBID Configuration ---
@@ -33,6 +34,19 @@ GROBID_SERVER_URL = "http://localhost:8070"
 GROBID_TIMEOUT = 120
 # Set to True to re-process a PDF even if its cleaned Markdown file already exists
 FORCE_REPROCESS_PDF = False
+# Set to True to also write each converted Markdown file to MD_CLEANED_DIR.
+# The pipeline passes Markdown between stages in memory, so this is only
+# useful for inspecting the XML-to-Markdown conversion.
+KEEP_CLEANED_MD = False
+# Number of PDFs sent to GROBID concurrently. GROBID scales close to linearly up to
+# its own worker count (typically 6-10), so keep this at or below that setting.
+GROBID_CONCURRENCY = 8
+# Number of concurrent LLM enrichment requests. The LLM endpoint is usually
+# rate-limited independently of GROBID, so it gets its own, smaller pool.
+LLM_CONCURRENCY = 2
+# PDFs up to this size (in bytes) are read into memory in one call and posted
+# as a regular multipart body; larger ones are streamed from disk.
+IN_MEMORY_PDF_MAX = 32 * 1024 * 1024
 
 
 # --- Logging Configuration ---
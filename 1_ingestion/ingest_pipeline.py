@@ -7,12 +7,27 @@ import time
 import logging
 import shutil
 import re
+import io
 import json
+import hashlib
+import threading
+import unicodedata
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from requests_toolbelt.multipart.encoder import MultipartEncoder
+from lxml import etree
 from txtai.text import TextSplitter
 from langchain_openai import ChatOpenAI
 
+# orjson is a much faster drop-in for (de)serializing JSON; fall back to the
+# standard library if it isn't installed.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # --- Add project root to sys.path ---
 # This allows for absolute imports of modules from the project root
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
@@ -38,6 +53,25 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# --- Shared HTTP Session ---
+# A single pooled session is shared by all worker threads, so every GROBID
+# upload reuses keep-alive connections instead of opening one per call.
+# Failures to connect are retried with backoff for every method, POST
+# included, as nothing has been sent yet; errors after the request went out
+# are only retried for idempotent methods, so an upload is never sent twice.
+_GROBID_SESSION = requests.Session()
+_GROBID_ADAPTER = HTTPAdapter(
+    pool_connections=ingest_config.GROBID_CONCURRENCY,
+    pool_maxsize=ingest_config.GROBID_CONCURRENCY,
+    max_retries=Retry(total=3, backoff_factor=0.3)
+)
+_GROBID_SESSION.mount("http://", _GROBID_ADAPTER)
+_GROBID_SESSION.mount("https://", _GROBID_ADAPTER)
+
+# PDFs are streamed to GROBID through a 1 MB read buffer rather than the
+# default 8 KB, so large scans are uploaded with far fewer read calls.
+_UPLOAD_BUFFER_SIZE = 1 << 20
+
 
 def check_grobid_server(url: str) -> bool:
     """
@@ -51,6 +85,8 @@ def check_grobid_server(url: str) -> bool:
     """
     ping_url = f"{url}/api/isalive"
     try:
+        # A plain request, not the retrying session, so a server that is down
+        # is reported at once rather than after the retries' backoff
         response = requests.get(ping_url, timeout=10)
         if response.status_code == 200:
             logger.info(f"✅ GROBID server is active at {url}")
@@ -79,83 +115,163 @@ def quarantine_file(pdf_path: Path, reason: str):
     except Exception as e:
         logger.error(f"Failed to move '{pdf_path.name}' to quarantine. Error: {e}")
 
-def process_pdf_with_grobid(pdf_path: Path, xml_path: Path) -> bool:
+def remove_file(path: Path):
+    """
+    Deletes an intermediate file, tolerating it having already been removed.
+
+    Args:
+        path (Path): The path to the file to be deleted.
+    """
+    try:
+        path.unlink(missing_ok=True)
+    except OSError as e:
+        logger.error(f"Failed to remove '{path.name}'. Error: {e}")
+
+def process_pdf_with_grobid(pdf_path: Path) -> tuple[bool, bytes | None]:
     """
     Sends a single PDF to the GROBID server for processing into TEI/XML.
 
     Args:
         pdf_path (Path): The path to the source PDF file.
-        xml_path (Path): The path where the output XML should be saved.
 
     Returns:
-        bool: True if processing was successful, False otherwise.
+        tuple[bool, bytes | None]: Whether processing succeeded, and the raw
+                                   TEI/XML response body (None on failure).
     """
     api_url = f"{ingest_config.GROBID_SERVER_URL}/api/processFulltextDocument"
 
     logger.info(f"Processing '{pdf_path.name}' with GROBID...")
 
     try:
-        with open(pdf_path, 'rb') as pdf_file:
-            # The file is sent as multipart-form data
-            files = {'input': (pdf_path.name, pdf_file, 'application/pdf', {'Expires': '0'})}
-
-            # Make the request to the GROBID API
-            response = requests.post(
+        if pdf_path.stat().st_size <= ingest_config.IN_MEMORY_PDF_MAX:
+            # Typical papers are a few MB: one read into memory is cheaper
+            # than feeding the upload through the file handle piece by piece
+            response = _GROBID_SESSION.post(
                 api_url,
-                files=files,
+                files={'input': (pdf_path.name, pdf_path.read_bytes(), 'application/pdf', {'Expires': '0'})},
                 timeout=ingest_config.GROBID_TIMEOUT
             )
+        else:
+            with open(pdf_path, 'rb', buffering=_UPLOAD_BUFFER_SIZE) as pdf_file:
+                # Large files are streamed as multipart-form data instead of
+                # being buffered into memory to build the request body
+                encoder = MultipartEncoder(
+                    fields={'input': (pdf_path.name, pdf_file, 'application/pdf', {'Expires': '0'})}
+                )
+
+                # Make the request to the GROBID API
+                response = _GROBID_SESSION.post(
+                    api_url,
+                    data=encoder,
+                    headers={'Content-Type': encoder.content_type},
+                    timeout=ingest_config.GROBID_TIMEOUT
+                )
 
         if response.status_code == 200:
-            # Write the successful response content to the XML file
-            with open(xml_path, 'w', encoding='utf-8') as xml_f:
-                xml_f.write(response.text)
-            logger.info(f"  -> Successfully created XML file: '{xml_path.name}'")
-            return True
+            # The XML is only consumed by the conversion step, so it is kept
+            # in memory as raw bytes and lxml handles the decoding
+            logger.info(f"  -> Successfully received TEI/XML for '{pdf_path.name}'")
+            return True, response.content
         else:
             # Handle API errors (e.g., bad request, server error)
             error_message = f"GROBID returned status {response.status_code}. Response: {response.text[:200]}..."
             logger.error(f"  -> Error processing '{pdf_path.name}': {error_message}")
             quarantine_file(pdf_path, error_message)
-            return False
+            return False, None
 
     except requests.exceptions.Timeout:
         timeout_message = f"Request timed out after {ingest_config.GROBID_TIMEOUT} seconds."
         logger.error(f"  -> Error processing '{pdf_path.name}': {timeout_message}")
         quarantine_file(pdf_path, timeout_message)
-        return False
+        return False, None
     except requests.exceptions.RequestException as e:
         network_error = f"A network error occurred: {e}"
         logger.error(f"  -> Error processing '{pdf_path.name}': {network_error}")
         quarantine_file(pdf_path, network_error)
-        return False
+        return False, None
     except Exception as e:
         unknown_error = f"An unexpected error occurred: {e}"
         logger.error(f"  -> Error processing '{pdf_path.name}': {unknown_error}")
         quarantine_file(pdf_path, unknown_error)
-        return False
+        return False, None
 
 
 # --- XML to Markdown Conversion ---
 
+# Compiled once at import; an explicit ASCII class avoids walking the
+# Unicode whitespace tables on every call.
+_WS_RE = re.compile(r'[ \t\n\r\f\v]+')
+
+# Single-pass translation table: drops non-printing control characters
+# (whitespace controls are kept for the collapse step), soft hyphens and
+# zero-width spaces, and turns the Unicode space separators (NBSP, thin,
+# em, ideographic and the like) into plain spaces, which the ASCII-only
+# collapse step then handles.
+_CTRL_TABLE = dict.fromkeys(c for c in (*range(32), 0x7f) if c not in (9, 10, 11, 12, 13))
+_CTRL_TABLE.update(dict.fromkeys((0x00ad, 0x200b, 0x2060, 0xfeff)))
+_CTRL_TABLE.update(dict.fromkeys((0x00a0, 0x1680, *range(0x2000, 0x200b), 0x202f, 0x205f, 0x3000), ' '))
+
 def clean_text(text: str) -> str:
     """
     Cleans and normalizes text extracted from XML elements.
+    - Removes control characters, soft hyphens and zero-width spaces;
+      Unicode spaces such as NBSP become plain spaces.
     - Replaces multiple spaces/newlines with a single space.
     - Strips leading/trailing whitespace.
+    - Normalizes to Unicode NFC so identical text is byte-identical.
+    """
+    text = _WS_RE.sub(' ', text.translate(_CTRL_TABLE)).strip()
+    # Pure ASCII is already in NFC; skip the normalization pass
+    if text.isascii():
+        return text
+    return unicodedata.normalize('NFC', text)
+
+# GROBID emits TEI documents in the TEI namespace
+TEI_NAMESPACE = "http://www.tei-c.org/ns/1.0"
+TEI_NS = {"tei": TEI_NAMESPACE}
+_TEI = f"{{{TEI_NAMESPACE}}}"
+
+# XPath selectors are compiled once at import and reused for every document.
+# In-text citations and footnotes are dropped before conversion.
+_UNWANTED_XPATH = etree.XPath("//tei:ref[@type='bibr'] | //tei:note[@place='foot']", namespaces=TEI_NS)
+_TITLE_XPATH = etree.XPath("//tei:titleStmt/tei:title", namespaces=TEI_NS)
+_ABSTRACT_XPATH = etree.XPath("//tei:abstract", namespaces=TEI_NS)
+_PARAGRAPH_XPATH = etree.XPath(".//tei:p", namespaces=TEI_NS)
+_BODY_DIV_XPATH = etree.XPath("//tei:body/tei:div", namespaces=TEI_NS)
+
+def remove_unwanted_elements(root):
+    """
+    Removes in-text citation references and footnotes from a parsed TEI tree
+    in a single XPath pass. The text following each removed element (its
+    tail) is kept, as it belongs to the surrounding sentence.
+    """
+    for node in _UNWANTED_XPATH(root):
+        parent = node.getparent()
+        if node.tail:
+            previous = node.getprevious()
+            if previous is not None:
+                previous.tail = (previous.tail or "") + node.tail
+            else:
+                parent.text = (parent.text or "") + node.tail
+        parent.remove(node)
+
+def element_text(element) -> str:
+    """
+    Returns the concatenated text of an lxml element. Serializing with the
+    text method does the concatenation in C without evaluating an XPath
+    expression; the tail belongs to the parent, so it is left out.
     """
-    text = re.sub(r'\s+', ' ', text)
-    return text.strip()
+    return etree.tostring(element, method="text", encoding="unicode", with_tail=False)
 
 def table_to_markdown(table_element) -> str:
     """
-    Converts a BeautifulSoup table element into a Markdown table string.
+    Converts an lxml TEI table element into a Markdown table string.
     """
     markdown_table = []
     header_processed = False
 
-    for row in table_element.find_all('row'):
-        cells = [clean_text(cell.get_text()) for cell in row.find_all('cell')]
+    for row in table_element.iterchildren(f"{_TEI}row"):
+        cells = [clean_text(element_text(cell)) for cell in row.iterchildren(f"{_TEI}cell")]
         markdown_table.append(f"| {' | '.join(cells)} |")
 
         if not header_processed:
@@ -165,149 +281,315 @@ def table_to_markdown(table_element) -> str:
 
     return "\n".join(markdown_table) + "\n"
 
-def convert_xml_to_md(xml_path: Path, md_path: Path, pdf_path: Path) -> bool:
+def convert_xml_to_md(xml_bytes: bytes, pdf_path: Path) -> tuple[bool, str | None]:
     """
-    Parses a GROBID TEI/XML file and converts it into a clean Markdown file.
+    Parses a GROBID TEI/XML document and converts it into clean Markdown.
+    If conversion fails, the XML is saved next to the quarantined PDF for
+    later inspection.
 
     Args:
-        xml_path (Path): The path to the input XML file.
-        md_path (Path): The path for the output Markdown file.
+        xml_bytes (bytes): The raw TEI/XML returned by GROBID.
         pdf_path (Path): The original PDF path, for quarantining on failure.
 
     Returns:
-        bool: True if conversion was successful, False otherwise.
+        tuple[bool, str | None]: Whether conversion succeeded, and the
+                                 Markdown text (None on failure).
     """
-    logger.info(f"Converting '{xml_path.name}' to Markdown...")
+    logger.info(f"Converting TEI/XML for '{pdf_path.name}' to Markdown...")
     try:
-        with open(xml_path, 'r', encoding='utf-8') as f:
-            soup = BeautifulSoup(f, 'lxml-xml')
+        root = etree.fromstring(xml_bytes)
 
-        markdown_parts = []
+        # Parts are written straight into one buffer; every part is followed
+        # by a blank line
+        buf = io.StringIO()
+        write = buf.write
 
         # Discard unwanted elements like in-text citations and footnotes
-        for ref in soup.find_all('ref', {'type': 'bibr'}):
-            ref.decompose()
-        for note in soup.find_all('note', {'place': 'foot'}):
-            note.decompose()
+        remove_unwanted_elements(root)
 
         # Extract Title
-        title_element = soup.find('titleStmt').find('title')
-        if title_element:
-            title = clean_text(title_element.get_text())
-            markdown_parts.append(f"# {title}\n")
+        titles = _TITLE_XPATH(root)
+        if titles:
+            title = clean_text(element_text(titles[0]))
+            write(f"# {title}\n\n")
 
         # Extract Abstract
-        abstract = soup.find('abstract')
-        if abstract:
-            markdown_parts.append("## Abstract\n")
-            for p in abstract.find_all('p'):
-                markdown_parts.append(clean_text(p.get_text()) + "\n")
+        abstracts = _ABSTRACT_XPATH(root)
+        if abstracts:
+            write("## Abstract\n\n")
+            for p in _PARAGRAPH_XPATH(abstracts[0]):
+                write(clean_text(element_text(p)))
+                write("\n\n")
 
         # Extract Body Content
-        body = soup.find('body')
-        if body:
-            for div in body.find_all('div', recursive=False):
-                head = div.find('head')
-                if head:
-                    level = head.get('n', '1').count('.') + 2
-                    heading_marker = '#' * level
-                    heading_text = clean_text(head.get_text())
-                    markdown_parts.append(f"\n{heading_marker} {heading_text}\n")
-
-                for element in div.find_all(['p', 'formula', 'figure'], recursive=False):
-                    if element.name == 'p':
-                        markdown_parts.append(clean_text(element.get_text()) + "\n")
-                    elif element.name == 'formula':
-                        formula_text = clean_text(element.get_text())
-                        markdown_parts.append(f"$$\n{formula_text}\n$$\n")
-                    elif element.name == 'figure':
-                        if element.find('table'):
-                            markdown_parts.append(table_to_markdown(element.find('table')))
-                        fig_desc = element.find('figDesc')
-                        if fig_desc:
-                            markdown_parts.append(f"[Image: {clean_text(fig_desc.get_text())}]\n")
-
-        # Write to Markdown file
-        final_markdown = "\n".join(markdown_parts)
-        with open(md_path, 'w', encoding='utf-8') as f:
-            f.write(final_markdown)
-
-        logger.info(f"  -> Successfully created Markdown file: '{md_path.name}'")
-        return True
+        for div in _BODY_DIV_XPATH(root):
+            head = div.find(".//tei:head", namespaces=TEI_NS)
+            if head is not None:
+                level = head.get('n', '1').count('.') + 2
+                heading_marker = '#' * level
+                heading_text = clean_text(element_text(head))
+                write(f"\n{heading_marker} {heading_text}\n\n")
+
+            # Paragraphs, formulas and figures are emitted in document order
+            for element in div.iterchildren(f"{_TEI}p", f"{_TEI}formula", f"{_TEI}figure"):
+                name = etree.QName(element).localname
+                if name == 'p':
+                    write(clean_text(element_text(element)))
+                    write("\n\n")
+                elif name == 'formula':
+                    formula_text = clean_text(element_text(element))
+                    write(f"$$\n{formula_text}\n$$\n\n")
+                elif name == 'figure':
+                    table = element.find(".//tei:table", namespaces=TEI_NS)
+                    if table is not None:
+                        write(table_to_markdown(table))
+                        write("\n")
+                    fig_desc = element.find(".//tei:figDesc", namespaces=TEI_NS)
+                    if fig_desc is not None:
+                        write(f"[Image: {clean_text(element_text(fig_desc))}]\n\n")
+
+        final_markdown = buf.getvalue()
+        logger.info(f"  -> Successfully converted TEI/XML for '{pdf_path.name}' to Markdown")
+        return True, final_markdown
 
     except Exception as e:
         error_message = f"Failed to convert XML to Markdown: {e}"
-        logger.error(f"  -> Error processing '{xml_path.name}': {error_message}")
+        logger.error(f"  -> Error processing '{pdf_path.name}': {error_message}")
         quarantine_file(pdf_path, error_message)
-        # Clean up the failed markdown file if it was created
-        if md_path.exists():
-            md_path.unlink()
-        return False
+        # Keep the offending XML alongside the PDF for a post-mortem
+        xml_path = ingest_config.QUARANTINED_DIR / f"{pdf_path.stem}.xml"
+        try:
+            xml_path.write_bytes(xml_bytes)
+        except OSError as write_error:
+            logger.error(f"Failed to save '{xml_path.name}' to quarantine. Error: {write_error}")
+        return False, None
 
 
 # --- LLM Validation and Enrichment ---
 
-def validate_and_enrich_with_llm(md_path: Path, pdf_path: Path, llm_client) -> dict | None:
+def load_json(content: str | bytes):
+    """
+    Parses a JSON document, using orjson when it is available.
+    Raises json.JSONDecodeError on malformed input either way.
+    """
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+def dump_json(data, indent: bool = False) -> bytes:
+    """
+    Serializes data to UTF-8 JSON bytes, using orjson when it is available.
+
+    Args:
+        data: The object to serialize.
+        indent (bool): Pretty-print with a two-space indent.
+    """
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(data, indent=2 if indent else None, ensure_ascii=False).encode('utf-8')
+
+# Rough characters-per-token ratio for English prose; good enough for a size gate
+_CHARS_PER_TOKEN = 4
+
+# Splits Markdown in front of each top-level section header, and after each
+# blank line for sections that are too large on their own
+_SECTION_SPLIT_RE = re.compile(r'^(?=## )', re.MULTILINE)
+_PARAGRAPH_SPLIT_RE = re.compile(r'(?<=\n\n)')
+
+_ENRICHMENT_KEYS = ("cleaned_text", "summary", "entities")
+
+
+class EnrichmentError(Exception):
+    """Raised when the LLM reply can't be used; the message is the quarantine reason."""
+
+
+def parse_llm_response(response_content, required_keys) -> dict:
+    """
+    Parses an LLM reply into a dict and checks it carries the expected keys.
+
+    Args:
+        response_content: The value returned by llm_client.invoke().
+        required_keys: Keys that must be present in the parsed reply.
+
+    Returns:
+        dict: The parsed reply.
+
+    Raises:
+        EnrichmentError: If the reply can't be parsed or lacks required keys.
+    """
+    # The response content should be a JSON string, so we parse it.
+    # This assumes the LLM (or mock) returns a string that can be parsed into the expected dict.
+    try:
+        # If the llm_client returns a string of JSON
+        if isinstance(response_content, str):
+            llm_response = load_json(response_content)
+        # If the llm_client returns a dict directly
+        elif isinstance(response_content, dict):
+            llm_response = response_content
+        else:
+            # Handle unexpected response types
+            raise TypeError(f"Unsupported LLM response type: {type(response_content)}")
+    except (json.JSONDecodeError, TypeError) as e:
+        logger.error(f"Failed to parse LLM response: {e}")
+        logger.error(f"Raw response content: {response_content}")
+        raise EnrichmentError("Failed to parse LLM JSON response.") from e
+
+    if not llm_response or not isinstance(llm_response, dict) or not all(k in llm_response for k in required_keys):
+        raise EnrichmentError("LLM response was invalid or missing required keys.")
+
+    return llm_response
+
+
+def split_markdown_sections(markdown_text: str, max_chars: int) -> list[str]:
+    """
+    Splits Markdown at top-level '## ' headers and greedily packs consecutive
+    sections into parts of at most max_chars. A single section larger than
+    the budget is split further on paragraph boundaries.
+
+    Args:
+        markdown_text (str): The full Markdown document.
+        max_chars (int): The size budget for each part, in characters.
+
+    Returns:
+        list[str]: The parts, in document order.
+    """
+    pieces = []
+    for section in _SECTION_SPLIT_RE.split(markdown_text):
+        if len(section) <= max_chars:
+            pieces.append(section)
+        else:
+            pieces.extend(_PARAGRAPH_SPLIT_RE.split(section))
+
+    parts = []
+    current = []
+    current_size = 0
+    for piece in filter(None, pieces):
+        if current and current_size + len(piece) > max_chars:
+            parts.append("".join(current))
+            current = []
+            current_size = 0
+        current.append(piece)
+        current_size += len(piece)
+    if current:
+        parts.append("".join(current))
+
+    return [part for part in parts if part.strip()]
+
+
+def request_enrichment(markdown_text: str, llm_client) -> dict:
     """
-    Uses an LLM to validate, clean, and enrich the Markdown content.
+    Sends one Markdown text to the LLM for validation and enrichment.
 
     Args:
-        md_path (Path): Path to the cleaned Markdown file.
+        markdown_text (str): The Markdown to enrich.
+        llm_client: An LLM client object that has an .invoke() method.
+
+    Returns:
+        dict: The reply with cleaned_text, summary, and entities.
+
+    Raises:
+        EnrichmentError: If the reply is unusable.
+    """
+    prompt = prompts.VALIDATION_ENRICHMENT_PROMPT.replace(prompts.MARKDOWN_PLACEHOLDER, markdown_text)
+    return parse_llm_response(llm_client.invoke(prompt), _ENRICHMENT_KEYS)
+
+
+def enrich_in_parts(parts: list[str], llm_client) -> dict:
+    """
+    Enriches each part of an oversized document in turn and merges the
+    replies: cleaned texts are joined in order, entities are de-duplicated
+    keeping first occurrence, and the partial summaries are summarized again.
+    Parts are sent one at a time because this already runs in an LLM pool
+    worker, and LLM_CONCURRENCY caps the calls in flight across documents.
+
+    Args:
+        parts (list[str]): The document parts, in order.
+        llm_client: An LLM client object that has an .invoke() method.
+
+    Returns:
+        dict: The merged cleaned_text, summary, and entities.
+
+    Raises:
+        EnrichmentError: If any part, or the final summary, fails.
+    """
+    replies = [request_enrichment(part, llm_client) for part in parts]
+
+    section_summaries = "\n\n".join(f"Part {i}: {reply['summary']}" for i, reply in enumerate(replies, start=1))
+    prompt = prompts.SUMMARY_MERGE_PROMPT.replace(prompts.SUMMARIES_PLACEHOLDER, section_summaries)
+    summary_reply = parse_llm_response(llm_client.invoke(prompt), ("summary",))
+
+    return {
+        "cleaned_text": "\n\n".join(reply["cleaned_text"] for reply in replies),
+        "summary": summary_reply["summary"],
+        "entities": list(dict.fromkeys(entity for reply in replies for entity in reply["entities"])),
+    }
+
+
+def validate_and_enrich_with_llm(markdown_text: str, pdf_path: Path, llm_client) -> dict | None:
+    """
+    Stage B: uses an LLM to validate, clean, and enrich the Markdown content.
+    Safe to call from worker threads. Documents whose estimated size exceeds
+    LLM_MAX_TOKENS are split by top-level section and enriched part by part,
+    since the model has to echo the cleaned text back within that budget.
+
+    Args:
+        markdown_text (str): The cleaned Markdown produced from the GROBID output.
         pdf_path (Path): The original PDF path, for quarantining on failure.
         llm_client: An LLM client object (e.g., ChatOpenAI or a mock) that has an .invoke() method.
 
     Returns:
         dict | None: A dictionary with cleaned_text, summary, and entities, or None on failure.
     """
-    logger.info(f"Validating and enriching '{md_path.name}' with LLM...")
+    logger.info(f"Validating and enriching '{pdf_path.name}' with LLM...")
 
     try:
-        with open(md_path, 'r', encoding='utf-8') as f:
-            markdown_text = f.read()
-
-        prompt = prompts.VALIDATION_ENRICHMENT_PROMPT.format(markdown_text=markdown_text)
-
-        # Use the injected LLM client
-        response_content = llm_client.invoke(prompt)
-
-        # The response content should be a JSON string, so we parse it.
-        # This assumes the LLM (or mock) returns a string that can be parsed into the expected dict.
-        # In a real scenario, more complex parsing or error handling might be needed
-        # if the llm_client.invoke returns a structured object directly.
-        try:
-            # If the llm_client returns a string of JSON
-            if isinstance(response_content, str):
-                 llm_response = json.loads(response_content)
-            # If the llm_client returns a dict directly
-            elif isinstance(response_content, dict):
-                 llm_response = response_content
-            else:
-                # Handle unexpected response types
-                raise TypeError(f"Unsupported LLM response type: {type(response_content)}")
-        except (json.JSONDecodeError, TypeError) as e:
-            logger.error(f"Failed to parse LLM response: {e}")
-            logger.error(f"Raw response content: {response_content}")
-            quarantine_file(pdf_path, "Failed to parse LLM JSON response.")
-            return None
-
-        if not llm_response or not all(k in llm_response for k in ["cleaned_text", "summary", "entities"]):
-            error_message = "LLM response was invalid or missing required keys."
-            logger.error(f"  -> Error processing '{md_path.name}': {error_message}")
-            quarantine_file(pdf_path, error_message)
-            return None
+        # --- Size gate: estimate tokens before paying for a doomed request ---
+        approx_tokens = len(markdown_text) // _CHARS_PER_TOKEN
+        if approx_tokens > main_config.LLM_MAX_TOKENS:
+            parts = split_markdown_sections(markdown_text, main_config.LLM_MAX_TOKENS * _CHARS_PER_TOKEN)
+            logger.info(f"  -> '{pdf_path.name}' is ~{approx_tokens} tokens; enriching in {len(parts)} parts.")
+            llm_response = enrich_in_parts(parts, llm_client)
+        else:
+            llm_response = request_enrichment(markdown_text, llm_client)
 
-        logger.info(f"  -> Successfully validated and enriched content for '{md_path.name}'.")
+        logger.info(f"  -> Successfully validated and enriched content for '{pdf_path.name}'.")
         return llm_response
 
+    except EnrichmentError as e:
+        logger.error(f"  -> Error processing '{pdf_path.name}': {e}")
+        quarantine_file(pdf_path, str(e))
+        return None
+
     except Exception as e:
         error_message = f"An unexpected error occurred during LLM validation: {e}"
-        logger.error(f"  -> Error processing '{md_path.name}': {error_message}")
+        logger.error(f"  -> Error processing '{pdf_path.name}': {error_message}")
         quarantine_file(pdf_path, error_message)
         return None
 
 
 # --- Semantic Chunking and Final Output ---
 
+# Built on first use and shared by every document; some split methods load
+# a tokenizer model, which is too costly to repeat per paper.
+_SPLITTER = None
+_SPLITTER_LOCK = threading.Lock()
+
+def get_text_splitter() -> TextSplitter:
+    """
+    Returns the shared TextSplitter, creating it on first call.
+    The lock only guards construction; splitting itself is stateless.
+    """
+    global _SPLITTER
+    if _SPLITTER is None:
+        with _SPLITTER_LOCK:
+            if _SPLITTER is None:
+                _SPLITTER = TextSplitter(
+                    method=main_config.CHUNK_METHOD,
+                    size=main_config.CHUNK_SIZE,
+                    overlap=main_config.CHUNK_OVERLAP
+                )
+    return _SPLITTER
+
 def chunk_text_with_txtai(text: str) -> list[str]:
     """
     Splits the text into semantic chunks using txtai.
@@ -320,39 +602,179 @@ def chunk_text_with_txtai(text: str) -> list[str]:
     """
     logger.info("Chunking text with txtai...")
     try:
-        text_splitter = TextSplitter(
-            method=main_config.CHUNK_METHOD,
-            size=main_config.CHUNK_SIZE,
-            overlap=main_config.CHUNK_OVERLAP
-        )
-        chunks = text_splitter(text)
+        chunks = get_text_splitter()(text)
         logger.info(f"  -> Successfully split text into {len(chunks)} chunks.")
         return chunks
     except Exception as e:
         logger.error(f"Failed to chunk text: {e}")
         return []
 
-def save_processed_data(output_path: Path, data: dict):
+def save_processed_data(output_path: Path, data: dict) -> bool:
     """
     Saves the final processed data to a JSON file.
 
     Args:
         output_path (Path): The path for the output JSON file.
         data (dict): The dictionary containing the processed data.
+
+    Returns:
+        bool: True if the file was written, False otherwise.
     """
     try:
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=4)
+        output_path.write_bytes(dump_json(data, indent=True))
         logger.info(f"  -> Successfully saved processed data to '{output_path.name}'")
+        return True
     except Exception as e:
         logger.error(f"Failed to save processed data to '{output_path.name}': {e}")
+        return False
+
+
+# --- Duplicate Detection ---
+
+# Files are hashed in 1 MB blocks to keep memory flat on large PDFs
+_HASH_BLOCK_SIZE = 1 << 20
+
+def compute_file_sha256(file_path: Path) -> str:
+    """
+    Computes the SHA-256 digest of a file, reading it in fixed-size blocks.
+
+    Args:
+        file_path (Path): The file to hash.
+
+    Returns:
+        str: The hexadecimal digest.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while block := f.read(_HASH_BLOCK_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_processed_hashes() -> set:
+    """
+    Loads the digests of previously ingested PDFs.
+
+    Returns:
+        set: The known SHA-256 digests; empty if none are recorded yet.
+    """
+    hashes_path = ingest_config.PROCESSED_HASHES_FILE
+    if not hashes_path.exists():
+        return set()
+    try:
+        return set(load_json(hashes_path.read_bytes()))
+    except Exception as e:
+        logger.error(f"Failed to read '{hashes_path.name}', duplicate detection starts empty: {e}")
+        return set()
+
+
+def save_processed_hashes(hashes: set):
+    """
+    Persists the digests of ingested PDFs. The file is written to a temporary
+    path first and then swapped in, so an interrupted run can't corrupt it.
+
+    Args:
+        hashes (set): The SHA-256 digests to record.
+    """
+    hashes_path = ingest_config.PROCESSED_HASHES_FILE
+    tmp_path = hashes_path.with_suffix(".tmp")
+    try:
+        tmp_path.write_bytes(dump_json(sorted(hashes)))
+        os.replace(tmp_path, hashes_path)
+    except Exception as e:
+        logger.error(f"Failed to save '{hashes_path.name}': {e}")
+
+
+# --- Pipeline Stages ---
+
+def extract_markdown(pdf_path: Path) -> str | None:
+    """
+    Stage A: sends a PDF to GROBID and converts the resulting TEI/XML into
+    Markdown. Safe to call from worker threads.
+
+    Args:
+        pdf_path (Path): The path to the source PDF file.
+
+    Returns:
+        str | None: The Markdown text, or None on failure.
+    """
+    logger.info(f"--- Processing: {pdf_path.name} ---")
+
+    # --- Step 1: Process PDF with GROBID to get XML ---
+    ok, xml_bytes = process_pdf_with_grobid(pdf_path)
+    if not ok:
+        # The function already logs and quarantines
+        return None
+
+    # --- Step 2: Convert XML to clean Markdown ---
+    ok, markdown_text = convert_xml_to_md(xml_bytes, pdf_path)
+    if not ok:
+        # The function already logs and quarantines
+        return None
+
+    # The Markdown is handed to the next stage in memory; it is only written
+    # out when explicitly requested, e.g. for inspecting the conversion.
+    if ingest_config.KEEP_CLEANED_MD:
+        md_path = ingest_config.MD_CLEANED_DIR / f"{pdf_path.stem}.md"
+        try:
+            md_path.write_text(markdown_text, encoding='utf-8')
+        except OSError as e:
+            logger.warning(f"  -> Could not keep Markdown copy '{md_path.name}': {e}")
+
+    return markdown_text
+
+def finalize_document(pdf_path: Path, enriched_data: dict, pdf_sha256: str | None = None) -> bool:
+    """
+    Stage C: chunks the enriched text and saves the final JSON output.
+
+    Args:
+        pdf_path (Path): The path to the source PDF file.
+        enriched_data (dict): The LLM output with cleaned_text, summary, and entities.
+        pdf_sha256 (str | None): SHA-256 digest of the source PDF, if known.
+
+    Returns:
+        bool: True if the PDF was fully processed, False otherwise.
+    """
+    base_name = pdf_path.stem
+
+    # --- Step 4: Semantic Chunking ---
+    chunks = chunk_text_with_txtai(enriched_data["cleaned_text"])
+    if not chunks:
+        quarantine_file(pdf_path, "Text chunking failed.")
+        return False
+
+    # --- Step 5: Save to JSON ---
+    final_output = {
+        "source_filename": pdf_path.name,
+        "document_summary": enriched_data["summary"],
+        "key_entities": enriched_data["entities"],
+        "chunks": chunks,
+        "pdf_sha256": pdf_sha256,
+        "processed_timestamp": time.time()
+    }
+
+    json_output_path = ingest_config.PROCESSED_DATA_DIR / f"{base_name}.json"
+    if not save_processed_data(json_output_path, final_output):
+        # Keep the PDF where it is, so the next run can process it again
+        logger.error(f"Leaving '{pdf_path.name}' in place; its output could not be saved.")
+        return False
+
+    # --- Final Step: Move original PDF to a 'processed' subfolder ---
+    # This prevents it from being processed again in the future.
+    # (For this implementation, we will just delete the original PDF
+    # as the README implies a one-way data flow)
+    remove_file(pdf_path)
+    logger.info(f"  -> Moved '{pdf_path.name}' after successful processing.")
+
+    logger.info(f"--- Finished processing: {pdf_path.name} ---")
+    return True
 
 
 def main():
     """
     Main function to orchestrate the ingestion pipeline.
-    Finds new PDFs, processes them with GROBID, converts to Markdown,
-    and prepares for the next steps.
+    Finds new PDFs and streams them through GROBID extraction, LLM
+    enrichment, and chunking, with each stage running concurrently.
     """
     logger.info("🚀 Starting ingestion pipeline...")
 
@@ -368,82 +790,86 @@ def main():
         model_name=main_config.LLM_MODEL_NAME
     )
 
-    pdf_files = list(ingest_config.PDF_SOURCE_DIR.glob("*.pdf"))
+    # scandir reports the entry type from the directory listing itself,
+    # so no per-file stat() is needed to filter the inbox
+    with os.scandir(ingest_config.PDF_SOURCE_DIR) as entries:
+        pdf_files = [Path(e.path) for e in entries if e.name.endswith('.pdf') and e.is_file(follow_symlinks=False)]
     if not pdf_files:
         logger.info("No new PDF files found to process.")
         return
 
     logger.info(f"Found {len(pdf_files)} PDF(s) to process.")
 
+    processed_hashes = load_processed_hashes()
+    pdf_hashes = {}
+    batch_hashes = set()
+
+    pending = []
     for pdf_path in pdf_files:
         base_name = pdf_path.stem
-        xml_path = ingest_config.XML_OUTPUT_DIR / f"{base_name}.xml"
-        md_path = ingest_config.MD_CLEANED_DIR / f"{base_name}.md"
-
-        # --- Skip if already processed, unless forcing ---
-        if md_path.exists() and not ingest_config.FORCE_REPROCESS_PDF:
-            logger.info(f"Skipping '{pdf_path.name}', Markdown file already exists.")
-            continue
-
-        logger.info(f"--- Processing: {pdf_path.name} ---")
-
-        # --- Step 1: Process PDF with GROBID to get XML ---
-        if not process_pdf_with_grobid(pdf_path, xml_path):
-            # The function already logs and quarantines, so just continue
-            continue
-
-        # --- Step 2: Convert XML to clean Markdown ---
-        if not convert_xml_to_md(xml_path, md_path, pdf_path):
-            # The function already logs and quarantines, so just continue
-            # Clean up the intermediate XML file on failure
-            if xml_path.exists():
-                xml_path.unlink()
-            continue
-
-        # --- Step 3: LLM Validation and Enrichment ---
-        enriched_data = validate_and_enrich_with_llm(md_path, pdf_path, llm_client)
-        if not enriched_data:
-            # The function already logs, quarantines, and cleans up.
-            if xml_path.exists(): xml_path.unlink()
-            if md_path.exists(): md_path.unlink()
-            continue
+        json_output_path = ingest_config.PROCESSED_DATA_DIR / f"{base_name}.json"
 
-        # --- Step 4: Semantic Chunking ---
-        chunks = chunk_text_with_txtai(enriched_data["cleaned_text"])
-        if not chunks:
-            quarantine_file(pdf_path, "Text chunking failed.")
-            if xml_path.exists(): xml_path.unlink()
-            if md_path.exists(): md_path.unlink()
+        # --- Skip if already processed or quarantined, unless forcing ---
+        # The final JSON is the authoritative marker of a completed run.
+        if not ingest_config.FORCE_REPROCESS_PDF:
+            if json_output_path.exists():
+                logger.info(f"Skipping '{pdf_path.name}', processed JSON already exists.")
+                continue
+            if (ingest_config.QUARANTINED_DIR / pdf_path.name).exists():
+                logger.info(f"Skipping '{pdf_path.name}', a copy is already in quarantine.")
+                continue
+
+        # --- Skip byte-identical duplicates before any GROBID work ---
+        # This catches papers that were re-downloaded under another name,
+        # both against earlier runs and within the current batch.
+        try:
+            pdf_sha256 = compute_file_sha256(pdf_path)
+        except OSError as e:
+            logger.error(f"Could not read '{pdf_path.name}' for hashing: {e}")
             continue
-
-        # --- Step 5: Save to JSON ---
-        final_output = {
-            "source_filename": pdf_path.name,
-            "document_summary": enriched_data["summary"],
-            "key_entities": enriched_data["entities"],
-            "chunks": chunks,
-            "processed_timestamp": time.time()
-        }
-
-        json_output_path = ingest_config.PROCESSED_DATA_DIR / f"{base_name}.json"
-        save_processed_data(json_output_path, final_output)
-
-        # --- Final Step: Move original PDF to a 'processed' subfolder ---
-        # This prevents it from being processed again in the future.
-        # (For this implementation, we will just delete the original PDF
-        # as the README implies a one-way data flow)
-        pdf_path.unlink()
-        logger.info(f"  -> Moved '{pdf_path.name}' after successful processing.")
-
-        # --- Cleanup intermediate files ---
-        if xml_path.exists():
-            xml_path.unlink()
-        if md_path.exists():
-            md_path.unlink()
-        logger.info(f"  -> Cleaned up intermediate files for '{pdf_path.name}'")
-
-        logger.info(f"--- Finished processing: {pdf_path.name} ---")
-        time.sleep(1) # Small delay to be polite
+        if not ingest_config.FORCE_REPROCESS_PDF:
+            if pdf_sha256 in processed_hashes or pdf_sha256 in batch_hashes:
+                logger.info(f"Skipping '{pdf_path.name}', identical content was already ingested.")
+                continue
+
+        pdf_hashes[pdf_path] = pdf_sha256
+        batch_hashes.add(pdf_sha256)
+        pending.append(pdf_path)
+
+    # --- Process PDFs as a pipeline ---
+    # GROBID extraction (stage A) and LLM enrichment (stage B) run on separate
+    # thread pools, so one paper's LLM call overlaps the next papers' GROBID
+    # work. Chunking and saving (stage C) stay on this thread.
+    completed = 0
+    with ThreadPoolExecutor(max_workers=ingest_config.GROBID_CONCURRENCY) as grobid_pool, \
+         ThreadPoolExecutor(max_workers=ingest_config.LLM_CONCURRENCY) as llm_pool:
+        in_flight = {grobid_pool.submit(extract_markdown, pdf_path): ("extract", pdf_path) for pdf_path in pending}
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, pdf_path = in_flight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    logger.error(f"Unexpected error while processing '{pdf_path.name}': {e}", exc_info=True)
+                    quarantine_file(pdf_path, f"An unexpected error occurred: {e}")
+                    result = None
+
+                if stage == "extract" and result is not None:
+                    # Stage A finished: hand the Markdown over to the LLM pool
+                    in_flight[llm_pool.submit(validate_and_enrich_with_llm, result, pdf_path, llm_client)] = ("enrich", pdf_path)
+                    continue
+
+                pdf_sha256 = pdf_hashes[pdf_path]
+                success = result is not None and finalize_document(pdf_path, result, pdf_sha256)
+                if success:
+                    # Persist right away so an interrupted run keeps its progress
+                    processed_hashes.add(pdf_sha256)
+                    save_processed_hashes(processed_hashes)
+                completed += 1
+                status = "Processed" if success else "Failed"
+                logger.info(f"({completed}/{len(pending)}) {status}: {pdf_path.name}")
 
     logger.info("✅ Ingestion pipeline run complete.")
 
@@ -3,6 +3,10 @@
 # This prompt is designed to be sent to a local LLM API endpoint.
 # It instructs the model to act as a data validation and enrichment specialist.
 # The model is expected to receive Markdown text and return a structured JSON object.
+# The input is inserted by replacing the MARKDOWN_PLACEHOLDER token, so the literal
+# JSON braces in the example output need no escaping.
+
+MARKDOWN_PLACEHOLDER = "<<MARKDOWN_TEXT>>"
 
 VALIDATION_ENRICHMENT_PROMPT = """
 You are a specialist in processing academic papers. Your task is to validate, clean, and enrich the provided Markdown text, which was extracted from a PDF.
@@ -29,5 +33,32 @@ You are a specialist in processing academic papers. Your task is to validate, cl
 
 **Input Markdown Text:**
 
-{markdown_text}
+<<MARKDOWN_TEXT>>
+"""
+
+# Used when a document is too long for a single enrichment request: each part is
+# enriched on its own and this prompt folds the per-part summaries into one.
+
+SUMMARIES_PLACEHOLDER = "<<SECTION_SUMMARIES>>"
+
+SUMMARY_MERGE_PROMPT = """
+You are a specialist in processing academic papers. The paper below was too long to summarize in one pass, so each of its parts was summarized separately.
+
+**Instructions:**
+
+1.  **Combine the Summaries:**
+    - Read the partial summaries, which are given in document order.
+    - Write a single, concise, academic-style summary of the entire document (around 150-200 words). It should capture the core research question, methods, results, and conclusions.
+    - Do not repeat information and do not mention that the input was split into parts.
+
+2.  **Format the Output:**
+    - Return a single, valid JSON object and nothing else.
+    - The JSON object must have the following structure:
+      {
+        "summary": "..."
+      }
+
+**Partial Summaries:**
+
+<<SECTION_SUMMARIES>>
 """
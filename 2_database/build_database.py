@@ -4,9 +4,18 @@ import os
 import sys
 import json
 import logging
+import itertools
 from pathlib import Path
+from typing import Iterator
 from txtai import Embeddings
 
+# orjson parses JSON considerably faster; fall back to the standard library
+# if it isn't installed.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # --- Add project root to sys.path ---
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 if project_root not in sys.path:
@@ -31,18 +40,76 @@ logger = logging.getLogger(__name__)
 PROCESSED_DATA_DIR = db_config.PROCESSED_DATA_DIR
 DATABASE_PATH = Path(main_config.DATABASE_PATH)
 
+# Sidecar cache of the indexed document stems, saved next to the database
+# so startup doesn't have to scan the whole table to rebuild the set
+INDEXED_FILES_PATH = DATABASE_PATH.with_suffix(".indexed.json")
+
 # Ensure the parent directory for the database exists
 DATABASE_PATH.parent.mkdir(parents=True, exist_ok=True)
 
 
+def database_mtime() -> float:
+    """
+    Returns the last modification time of the saved database. txtai saves
+    an index as a directory of files, and rewriting a file doesn't touch
+    the directory's own mtime, so the newest entry inside is used.
+
+    Returns:
+        float: The most recent modification timestamp.
+    """
+    mtime = DATABASE_PATH.stat().st_mtime
+    if DATABASE_PATH.is_dir():
+        with os.scandir(DATABASE_PATH) as entries:
+            for entry in entries:
+                mtime = max(mtime, entry.stat().st_mtime)
+    return mtime
+
+
+def load_indexed_files_cache() -> set | None:
+    """
+    Reads the sidecar set of indexed document stems, if it is still valid.
+
+    Returns:
+        set | None: The cached stems, or None if the sidecar is missing,
+                    unreadable, or older than the database.
+    """
+    try:
+        if INDEXED_FILES_PATH.stat().st_mtime < database_mtime():
+            logger.info("Indexed-files cache is older than the database; ignoring it.")
+            return None
+        return set(load_processed_json(INDEXED_FILES_PATH))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Could not read indexed-files cache '{INDEXED_FILES_PATH.name}': {e}")
+        return None
+
+
+def save_indexed_files_cache(indexed_files: set):
+    """
+    Writes the sidecar set of indexed document stems. Must run after the
+    database is saved so that its mtime marks it as current.
+
+    Args:
+        indexed_files (set): Stems of every document in the database.
+    """
+    try:
+        if orjson is not None:
+            INDEXED_FILES_PATH.write_bytes(orjson.dumps(sorted(indexed_files)))
+        else:
+            INDEXED_FILES_PATH.write_text(json.dumps(sorted(indexed_files)), encoding='utf-8')
+    except Exception as e:
+        logger.warning(f"Failed to write indexed-files cache '{INDEXED_FILES_PATH.name}': {e}")
+
+
 def load_or_initialize_embeddings() -> tuple[Embeddings, set]:
     """
     Loads an existing txtai Embeddings index or initializes a new one.
-    Also returns the set of already indexed source filenames.
+    Also returns the set of already indexed source documents.
 
     Returns:
         tuple[Embeddings, set]: A tuple containing the Embeddings object
-                                and a set of processed source filenames.
+                                and a set of indexed document stems.
     """
     embeddings = Embeddings()
     indexed_files = set()
@@ -51,9 +118,21 @@ def load_or_initialize_embeddings() -> tuple[Embeddings, set]:
         logger.info(f"Loading existing database from: {DATABASE_PATH}")
         try:
             embeddings.load(str(DATABASE_PATH))
-            # Query the loaded index to find out which files are already in it
-            results = embeddings.search("SELECT DISTINCT source_filename FROM txtai", limit=10000)
-            indexed_files = {r['source_filename'] for r in results}
+            cached_files = load_indexed_files_cache()
+            if cached_files is not None:
+                indexed_files = cached_files
+            else:
+                # Query the loaded index to find out which files are already in it.
+                # The row count bounds the number of distinct filenames, so the
+                # query never truncates no matter how large the corpus grows.
+                total_rows = embeddings.count()
+                if total_rows:
+                    results = embeddings.search(
+                        "SELECT DISTINCT source_filename FROM txtai", limit=total_rows
+                    )
+                    # source_filename holds the original PDF name while processed
+                    # files are named '<stem>.json', so compare on the stem.
+                    indexed_files = {Path(r['source_filename']).stem for r in results}
             logger.info(f"Found {len(indexed_files)} already indexed files.")
         except Exception as e:
             logger.error(f"Failed to load existing database. A new one will be created. Error: {e}")
@@ -61,42 +140,90 @@ def load_or_initialize_embeddings() -> tuple[Embeddings, set]:
             embeddings = Embeddings()
     else:
         logger.info("No existing database found. Initializing a new one.")
-        # Configure the new embeddings using the model from the main config
+        # Configure the new embeddings using the model from the main config.
+        # Only the selected backend's build settings are stored with the index.
+        backend = main_config.ANN_BACKEND
+        backend_settings = main_config.ANN_CONFIG.get(backend)
         embeddings = Embeddings(
             path=main_config.SENTENCE_TRANSFORMER_MODEL,
-            content=True
+            content=True,
+            backend=backend,
+            **({backend: backend_settings} if backend_settings else {})
         )
 
     return embeddings, indexed_files
 
 
-def prepare_data_for_indexing(json_data: dict) -> list[dict]:
+def prepare_data_for_indexing(json_data: dict) -> Iterator[dict]:
     """
     Prepares the data from a single JSON file for txtai indexing.
 
     Args:
         json_data (dict): The loaded content of a processed JSON file.
 
-    Returns:
-        list[dict]: A list of dictionaries, where each dictionary represents
-                    a chunk ready to be indexed.
+    Yields:
+        dict: One dictionary per chunk, ready to be indexed.
     """
-    prepared_data = []
     source_filename = json_data.get("source_filename", "Unknown")
+    chunk_prefix = Path(source_filename).stem
+    document_summary = json_data.get("document_summary", "")
+    key_entities = json_data.get("key_entities", [])
 
     for i, chunk_text in enumerate(json_data.get("chunks", [])):
-        chunk_id = f"{Path(source_filename).stem}_chunk_{i+1:03d}"
-
-        chunk_data = {
-            "id": chunk_id, # txtai uses 'id' field for uniqueness
+        yield {
+            "id": f"{chunk_prefix}_chunk_{i+1:03d}", # txtai uses 'id' field for uniqueness
             "text": chunk_text,
             "source_filename": source_filename,
-            "document_summary": json_data.get("document_summary", ""),
-            "key_entities": json_data.get("key_entities", [])
+            "document_summary": document_summary,
+            "key_entities": key_entities
         }
-        prepared_data.append(chunk_data)
 
-    return prepared_data
+
+def load_processed_json(json_path: Path) -> dict:
+    """
+    Reads a processed JSON file produced by the ingestion pipeline.
+
+    Args:
+        json_path (Path): Path to the processed JSON file.
+
+    Returns:
+        dict: The parsed file content.
+    """
+    if orjson is not None:
+        return orjson.loads(json_path.read_bytes())
+    with open(json_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def iter_new_chunks(files_to_index: list[Path], stats: dict) -> Iterator[dict]:
+    """
+    Lazily yields index-ready chunks from each new JSON file, one file at a
+    time, so the full payload is never held in memory.
+
+    Args:
+        files_to_index (list[Path]): Processed JSON files to index.
+        stats (dict): Updated in place: 'files' and 'chunks' counters and
+                      the 'stems' set of successfully loaded documents.
+
+    Yields:
+        dict: One chunk dictionary at a time.
+    """
+    for json_path in files_to_index:
+        try:
+            data = load_processed_json(json_path)
+        except Exception as e:
+            logger.error(f"Failed to load or process '{json_path.name}'. Skipping. Error: {e}")
+            continue
+
+        chunk_count = 0
+        for chunk_data in prepare_data_for_indexing(data):
+            chunk_count += 1
+            yield chunk_data
+
+        stats["files"] += 1
+        stats["chunks"] += chunk_count
+        stats["stems"].add(json_path.stem)
+        logger.info(f"  -> Prepared {chunk_count} chunks from '{json_path.name}'")
 
 
 def main():
@@ -107,10 +234,12 @@ def main():
 
     embeddings, indexed_files = load_or_initialize_embeddings()
 
-    all_json_files = list(PROCESSED_DATA_DIR.glob("*.json"))
+    # scandir avoids a stat() per file when listing the processed directory
+    with os.scandir(PROCESSED_DATA_DIR) as entries:
+        all_json_files = [Path(e.path) for e in entries if e.name.endswith('.json') and e.is_file(follow_symlinks=False)]
 
     # Determine which files are new and need to be indexed
-    files_to_index = [f for f in all_json_files if f.name not in indexed_files]
+    files_to_index = [f for f in all_json_files if f.stem not in indexed_files]
 
     if not files_to_index:
         logger.info("✅ Database is already up-to-date. No new files to index.")
@@ -118,25 +247,22 @@ def main():
 
     logger.info(f"Found {len(files_to_index)} new document(s) to index.")
 
-    all_new_data = []
-    for json_path in files_to_index:
-        try:
-            with open(json_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-
-            prepared_data = prepare_data_for_indexing(data)
-            all_new_data.extend(prepared_data)
-            logger.info(f"  -> Prepared {len(prepared_data)} chunks from '{json_path.name}'")
-        except (json.JSONDecodeError, Exception) as e:
-            logger.error(f"Failed to load or process '{json_path.name}'. Skipping. Error: {e}")
+    stats = {"files": 0, "chunks": 0, "stems": set()}
+    chunk_stream = iter_new_chunks(files_to_index, stats)
 
-    if all_new_data:
-        logger.info(f"Indexing {len(all_new_data)} new chunks...")
-        # The index method takes an iterable of dictionaries
-        embeddings.index(all_new_data)
+    # Peek at the first chunk so an empty stream doesn't trigger a rebuild
+    first_chunk = next(chunk_stream, None)
+    if first_chunk is not None:
+        logger.info("Indexing new chunks...")
+        # upsert consumes any iterable of dictionaries, so chunks are streamed
+        # straight from disk. It adds to a loaded index (index() would replace
+        # it) and builds a fresh one when nothing has been indexed yet.
+        embeddings.upsert(itertools.chain([first_chunk], chunk_stream))
+        logger.info(f"Indexed {stats['chunks']} new chunks from {stats['files']} document(s).")
 
         logger.info(f"Saving updated database to: {DATABASE_PATH}")
         embeddings.save(str(DATABASE_PATH))
+        save_indexed_files_cache(indexed_files | stats["stems"])
         logger.info("✅ Database save complete.")
     else:
         logger.warning("No new data was successfully prepared for indexing.")
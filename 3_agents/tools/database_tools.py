@@ -1,34 +1,183 @@
 # 3_agents/tools/database_tools.py
 
+import json
 import logging
 import os
 import sys
+import threading
 from pathlib import Path
+from typing import Final
+
+import numpy as np
 from txtai import Embeddings
+from txtai.ann import NumPy
+from txtai.version import __version__ as TXTAI_VERSION
 from crewai import tool
 
+# simsimd provides SIMD similarity kernels; search falls back to NumPy's dot
+# product if it isn't installed.
+try:
+    import simsimd
+except ImportError:
+    simsimd = None
+
 # --- Add project root to sys.path ---
-project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
-if project_root not in sys.path:
-    sys.path.insert(0, project_root)
+PROJECT_ROOT: Final[Path] = Path(__file__).resolve().parents[2]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
 
 # --- Configuration Imports ---
 from config import main_config
 
+# --- Path Constants ---
+# DATABASE_PATH is relative to the project root, not the working directory
+DB_PATH: Final[Path] = PROJECT_ROOT / main_config.DATABASE_PATH
+
 # --- Setup Logging ---
 # It's good practice for tool modules to have their own logger.
 logger = logging.getLogger(__name__)
 
+# --- SIMD Scoring ---
+
+# txtai's NumPy backend scores queries through its private 'dot' attribute.
+# That hook is only relied on for the major release it was written against.
+_SIMD_TXTAI_MAJOR: Final[str] = "6"
+
+def _simd_dot(queries, backend_t):
+    """
+    Drop-in replacement for the np.dot call in txtai's NumPy ANN search,
+    which scores queries against the transposed index matrix. The vectors
+    are normalized, so the dot product is the cosine similarity.
+    """
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    return np.asarray(simsimd.cdist(queries, backend_t.T, metric="dot"))
+
+def _install_simd_scoring(index: Embeddings):
+    """
+    Routes similarity scoring of a NumPy-backed index through simsimd.
+    Other backends (Faiss, HNSW, GPU tensors) are left untouched.
+    """
+    ann = getattr(index, "ann", None)
+    if simsimd is None or type(ann) is not NumPy:
+        return
+    if TXTAI_VERSION.split(".")[0] != _SIMD_TXTAI_MAJOR or not callable(getattr(ann, "dot", None)):
+        logger.warning(f"simsimd scoring is not supported with txtai {TXTAI_VERSION}; using NumPy.")
+        return
+
+    # simsimd works on contiguous float32 rows; convert once at load time
+    ann.backend = np.ascontiguousarray(ann.backend, dtype=np.float32)
+    ann.dot = _simd_dot
+    logger.info("Using simsimd kernels for similarity search.")
+
+# --- HNSW Search ---
+
+def _configure_hnsw_search(index: Embeddings):
+    """
+    Sets the HNSW query-time search breadth from the config. txtai reads the
+    'efsearch' setting on every search, so it can be changed without a rebuild.
+    """
+    if index.config.get("backend") == "hnsw":
+        index.config.setdefault("hnsw", {})["efsearch"] = main_config.ANN_EF_SEARCH
+
+
+# --- Quantized Search ---
+
+def _quantize_i8(vectors):
+    """
+    Scales each row to the int8 range by its own largest magnitude.
+    All-zero rows (deleted entries) stay zero.
+    """
+    peak = np.abs(vectors).max(axis=1, keepdims=True)
+    peak[peak == 0] = 1.0
+    return np.round(vectors * (127.0 / peak)).astype(np.int8)
+
+def _quantize_f16(vectors):
+    """
+    Converts to IEEE half precision.
+    """
+    return vectors.astype(np.float16)
+
+def _quantize_bf16(vectors):
+    """
+    Converts to bfloat16, stored as uint16 since NumPy has no bf16 type.
+    Keeps the top 16 bits of each float32, rounded to nearest even.
+    NaNs map to a quiet NaN, since rounding could carry them into Inf.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    bits = vectors.view(np.uint32)
+    rounded = ((bits + 0x7FFF + ((bits >> 16) & 1)) >> 16).astype(np.uint16)
+    return np.where(np.isnan(vectors), np.uint16(0x7FC0), rounded)
+
+def _quantize_b1(vectors):
+    """
+    Keeps the sign of every dimension, packed eight dimensions per byte.
+    """
+    return np.packbits(vectors > 0, axis=1)
+
+def _install_quantized_search(index: Embeddings):
+    """
+    Replaces the NumPy backend's search with a two-phase search: a scan of
+    quantized codes picks QUANT_RERANK_FACTOR * limit candidates, which are
+    then re-scored exactly against the float32 vectors.
+    """
+    dtype = main_config.QUANT_DTYPE
+    ann = getattr(index, "ann", None)
+    if dtype == "fp32" or type(ann) is not NumPy:
+        return
+    if simsimd is None:
+        logger.warning(f"QUANT_DTYPE '{dtype}' requires simsimd; using full-precision search.")
+        return
+
+    vectors = np.ascontiguousarray(ann.backend, dtype=np.float32)
+    if dtype == "fp16":
+        quantize, metric, kind = _quantize_f16, "cosine", "float16"
+    elif dtype == "bf16":
+        quantize, metric, kind = _quantize_bf16, "cosine", "bf16"
+    elif dtype == "i8":
+        quantize, metric, kind = _quantize_i8, "cosine", "int8"
+    elif dtype == "b1":
+        quantize, metric, kind = _quantize_b1, "hamming", "bin8"
+    else:
+        logger.warning(f"Unknown QUANT_DTYPE '{dtype}'; using full-precision search.")
+        return
+    codes = quantize(vectors)
+
+    def search(queries, limit):
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        # Both metrics are distances: smaller means more similar
+        distances = np.asarray(simsimd.cdist(quantize(queries), codes, metric=metric, dtype=kind))
+
+        n_candidates = min(len(vectors), limit * main_config.QUANT_RERANK_FACTOR)
+        if n_candidates < len(vectors):
+            candidates = np.argpartition(distances, n_candidates - 1, axis=1)[:, :n_candidates]
+        else:
+            candidates = np.tile(np.arange(len(vectors)), (len(queries), 1))
+
+        results = []
+        for query, ids in zip(queries, candidates):
+            # Exact cosine on the shortlist restores full-precision ranking
+            scores = vectors[ids] @ query
+            order = np.argsort(-scores)[:limit]
+            results.append(list(zip(ids[order].tolist(), scores[order].tolist())))
+        return results
+
+    ann.search = search
+    logger.info(f"Using {dtype} quantized search with float32 re-ranking.")
+
+
 # --- Global Embeddings Object ---
-# We load the database once when the module is imported for efficiency.
-embeddings = None
+# The database (and its embedding model) is loaded on first use rather than at
+# import, so importing the tools, e.g. for test collection, stays cheap.
+_NOT_LOADED = object()
+embeddings = _NOT_LOADED
+_load_lock = threading.Lock()
 
 def _load_database():
     """
     Internal function to load the txtai database into the global `embeddings` object.
     """
     global embeddings
-    db_path = Path(main_config.DATABASE_PATH)
+    db_path = DB_PATH
 
     if not db_path.exists():
         logger.error(f"Database not found at {db_path}. The database tools will not be available.")
@@ -38,20 +187,100 @@ def _load_database():
 
     try:
         logger.info(f"Loading database from: {db_path}")
-        embeddings = Embeddings()
-        embeddings.load(str(db_path))
+        index = Embeddings()
+        index.load(str(db_path))
+        _configure_hnsw_search(index)
+        _install_simd_scoring(index)
+        _install_quantized_search(index)
+        # Publish only the fully prepared index to other threads
+        embeddings = index
         logger.info("✅ Database loaded successfully.")
     except Exception as e:
         logger.error(f"Failed to load the database from {db_path}. Error: {e}")
         embeddings = None
 
-# --- Initial Load ---
-# Load the database when this module is first imported.
-_load_database()
+def get_embeddings(load: bool = True):
+    """
+    Returns the loaded database, loading it on the first call.
+
+    Args:
+        load (bool): Whether to load the database if it isn't loaded yet.
+
+    Returns:
+        Embeddings: The txtai index, or None if the database is unavailable
+                    (or not loaded yet and `load` is False).
+    """
+    if embeddings is _NOT_LOADED:
+        if not load:
+            return None
+        with _load_lock:
+            if embeddings is _NOT_LOADED:
+                _load_database()
+    return embeddings
+
+def database_mtime() -> float | None:
+    """
+    Returns the last modification time of the saved database. txtai saves
+    an index as a directory of files, and rewriting a file doesn't touch
+    the directory's own mtime, so the newest entry inside is used.
+
+    Returns:
+        float | None: The most recent modification timestamp, or None if
+                      there is no saved database.
+    """
+    try:
+        mtime = DB_PATH.stat().st_mtime
+        if DB_PATH.is_dir():
+            with os.scandir(DB_PATH) as entries:
+                for entry in entries:
+                    mtime = max(mtime, entry.stat().st_mtime)
+        return mtime
+    except FileNotFoundError:
+        return None
 
 
 # --- Database Tools ---
 
+# txtai only returns id, text and score for a plain text query, so the source
+# column is selected explicitly. The query text is bound, never interpolated.
+_SIMILAR_SQL = "SELECT id, text, source_filename, score FROM txtai WHERE similar(:query)"
+
+def _format_result(i: int, res: dict) -> str:
+    """
+    Formats a single search hit for the agent.
+    """
+    return (
+        f"--- Result {i+1} (Score: {res['score']:.4f}) ---\n"
+        f"Chunk ID: {res['id']}\n"
+        f"Source: {res['source_filename']}\n"
+        f"Text: \"{res['text']}\"\n\n"
+    )
+
+def _format_chunk(chunk_id: str, res: dict) -> str:
+    """
+    Formats a chunk retrieved by its ID.
+    """
+    return (
+        f"Content for Chunk ID: {chunk_id}\n"
+        f"Source: {res['source_filename']}\n"
+        f"Text: \"{res['text']}\""
+    )
+
+def _parse_queries(queries) -> list[str]:
+    """
+    Normalizes the queries argument of the batch tool. Agents may pass a real
+    list, a JSON-encoded list, or one query per line.
+    """
+    if isinstance(queries, str):
+        try:
+            queries = json.loads(queries)
+        except json.JSONDecodeError:
+            queries = queries.splitlines()
+        if isinstance(queries, str):
+            queries = [queries]
+    return [str(q).strip() for q in queries if str(q).strip()]
+
+
 @tool("Query Database for Relevant Chunks")
 def query_database(query: str, top_k: int = 5) -> str:
     """
@@ -67,30 +296,72 @@ def query_database(query: str, top_k: int = 5) -> str:
              informative message if no results are found or if the
              database is unavailable.
     """
+    embeddings = get_embeddings()
     if embeddings is None:
         return "Database is not available. Please ensure it has been built correctly."
 
     try:
-        results = embeddings.search(query, limit=top_k)
+        results = embeddings.search(_SIMILAR_SQL, limit=top_k, parameters={"query": query})
 
         if not results:
             return "No relevant information was found in the database for your query."
 
         # Format the results into a readable string for the agent
-        output_str = f"Found {len(results)} relevant chunks for your query:\n\n"
+        parts = [f"Found {len(results)} relevant chunks for your query:\n\n"]
         for i, res in enumerate(results):
-            output_str += f"--- Result {i+1} (Score: {res['score']:.4f}) ---\n"
-            output_str += f"Chunk ID: {res['id']}\n"
-            output_str += f"Source: {res['source_filename']}\n"
-            output_str += f"Text: \"{res['text']}\"\n\n"
+            parts.append(_format_result(i, res))
 
-        return output_str.strip()
+        return "".join(parts).strip()
 
     except Exception as e:
         logger.error(f"An error occurred during database query: {e}")
         return "An error occurred while searching the database. Please check the logs."
 
 
+@tool("Batch Query")
+def query_database_batch(queries: list[str], top_k: int = 5) -> str:
+    """
+    Runs several semantic searches at once. All queries are embedded in a
+    single model pass and scored against the index in one matrix product,
+    which is much faster than calling the single-query tool repeatedly.
+
+    Args:
+        queries (list[str]): The search queries, as a list or a JSON list string.
+        top_k (int): The number of top results to return per query.
+
+    Returns:
+        str: The results for each query under its own heading, or an
+             informative message if the database is unavailable.
+    """
+    embeddings = get_embeddings()
+    if embeddings is None:
+        return "Database is not available. Please ensure it has been built correctly."
+
+    queries = _parse_queries(queries)
+    if not queries:
+        return "No queries were provided."
+
+    try:
+        batch_results = embeddings.batchsearch(
+            [_SIMILAR_SQL] * len(queries), limit=top_k, parameters=[{"query": q} for q in queries]
+        )
+
+        sections = []
+        for query, results in zip(queries, batch_results):
+            if not results:
+                sections.append(f"=== Query: {query} ===\nNo relevant information was found in the database for this query.")
+                continue
+            section = f"=== Query: {query} ===\nFound {len(results)} relevant chunks:\n\n"
+            section += "".join(_format_result(i, res) for i, res in enumerate(results))
+            sections.append(section.strip())
+
+        return "\n\n".join(sections)
+
+    except Exception as e:
+        logger.error(f"An error occurred during batch database query: {e}")
+        return "An error occurred while searching the database. Please check the logs."
+
+
 @tool("Retrieve Specific Chunk by ID")
 def get_chunk_by_id(chunk_id: str) -> str:
     """
@@ -104,26 +375,68 @@ def get_chunk_by_id(chunk_id: str) -> str:
              or an informative message if the ID is not found or the
              database is unavailable.
     """
+    embeddings = get_embeddings()
     if embeddings is None:
         return "Database is not available. Please ensure it has been built correctly."
 
     try:
-        # Use a SQL-like query to fetch the specific chunk by its ID
-        query = f"SELECT text, source_filename FROM txtai WHERE id = '{chunk_id}'"
-        result = embeddings.search(query)
+        # Primary-key lookup with the ID bound as a parameter, so quotes in
+        # an ID can't alter the query and it is never parsed as SQL text
+        result = embeddings.search(
+            "SELECT text, source_filename FROM txtai WHERE id = :id",
+            limit=1,
+            parameters={"id": chunk_id}
+        )
 
         if not result:
             return f"The specified chunk ID '{chunk_id}' does not exist in the database."
 
         # Format the result into a readable string
-        res = result[0]
-        output_str = (
-            f"Content for Chunk ID: {chunk_id}\n"
-            f"Source: {res['source_filename']}\n"
-            f"Text: \"{res['text']}\""
-        )
-        return output_str
+        return _format_chunk(chunk_id, result[0])
 
     except Exception as e:
         logger.error(f"An error occurred while retrieving chunk by ID '{chunk_id}': {e}")
         return "An error occurred while retrieving the chunk. Please check the logs."
+
+
+def get_chunks_by_ids(ids: list[str]) -> dict[str, str]:
+    """
+    Retrieves the content of several chunks in a single database query.
+    The app uses this to show cited sources; it is not an agent tool.
+
+    Args:
+        ids (list[str]): The unique IDs of the chunks to retrieve.
+
+    Returns:
+        dict[str, str]: A mapping of each requested ID to its formatted
+                        content and source, or to an informative message if
+                        the ID is not found or the database is unavailable.
+    """
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return {}
+
+    embeddings = get_embeddings()
+    if embeddings is None:
+        message = "Database is not available. Please ensure it has been built correctly."
+        return {chunk_id: message for chunk_id in ids}
+
+    try:
+        # One bound placeholder per ID, so the whole set is a single IN query
+        placeholders = ", ".join(f":id{i}" for i in range(len(ids)))
+        results = embeddings.search(
+            f"SELECT id, text, source_filename FROM txtai WHERE id IN ({placeholders})",
+            limit=len(ids),
+            parameters={f"id{i}": chunk_id for i, chunk_id in enumerate(ids)}
+        )
+        found = {res["id"]: _format_chunk(res["id"], res) for res in results}
+
+        return {
+            chunk_id: found.get(chunk_id, f"The specified chunk ID '{chunk_id}' does not exist in the database.")
+            for chunk_id in ids
+        }
+
+    except Exception as e:
+        logger.error(f"An error occurred while retrieving chunks by ID {ids}: {e}")
+        message = "An error occurred while retrieving the chunk. Please check the logs."
+        return {chunk_id: message for chunk_id in ids}
@@ -1,18 +1,30 @@
 # agents/agent_crew.py
 
-import os
 import sys
 import logging
+import re
+import threading
+from collections import deque
+from functools import lru_cache
 from pathlib import Path
+from typing import Final
+
+import numpy as np
 
 # --- Add project root to sys.path ---
 # This is crucial for ensuring the script can find top-level modules like `config`
-project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-if project_root not in sys.path:
-    sys.path.insert(0, project_root)
+PROJECT_ROOT: Final[Path] = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+# --- Path Constants ---
+LOG_FILE: Final[Path] = PROJECT_ROOT / "logs/app.log"
+PROMPT_DIR: Final[Path] = PROJECT_ROOT / "config/prompts"
 
 # --- Imports ---
 from crewai import Agent, Crew, Process, Task
+from langchain_core.caches import InMemoryCache
+from langchain_core.globals import set_llm_cache
 from langchain_openai import ChatOpenAI
 
 from config import main_config
@@ -20,25 +32,43 @@ from agents.tools import database_tools
 
 # --- Setup Logging ---
 # Configure a logger for the agentic system
-log_file = Path(project_root) / "logs/app.log"
-log_file.parent.mkdir(parents=True, exist_ok=True)
-
-logging.basicConfig(
-    level=logging.INFO if main_config.VERBOSE_LOGGING else logging.WARNING,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[
-        logging.FileHandler(log_file),
-        logging.StreamHandler()
-    ]
-)
+LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
+
+# Streamlit re-imports this module on reruns; configure the root logger only
+# once so handlers (and open log files) don't pile up and duplicate lines.
+if not logging.getLogger().handlers:
+    logging.basicConfig(
+        level=logging.INFO if main_config.VERBOSE_LOGGING else logging.WARNING,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        handlers=[
+            logging.FileHandler(LOG_FILE),
+            logging.StreamHandler()
+        ]
+    )
 logger = logging.getLogger(__name__)
 
+# CrewAI's verbose mode prints every agent step to stdout, which is slow on
+# the token path; it follows the same switch as the rest of the logging.
+VERBOSE: Final[bool] = main_config.VERBOSE_LOGGING
 
+def enable_llm_cache():
+    """
+    Installs a process-wide LLM call cache, so identical prompts issued by the
+    agents (within or across runs) are answered from memory instead of going
+    back to the model. Called once by the application at startup; the oldest
+    entries are evicted beyond LLM_CACHE_SIZE.
+    """
+    set_llm_cache(InMemoryCache(maxsize=main_config.LLM_CACHE_SIZE))
+    logger.info(f"LLM call cache enabled (max {main_config.LLM_CACHE_SIZE} entries).")
+
+
+@lru_cache(maxsize=None)
 def load_prompt(file_name: str) -> str:
     """
     Loads a prompt from a file in the config/prompts directory.
+    Each file is read once per process; later calls return the cached text.
     """
-    prompt_path = Path(project_root) / "config/prompts" / file_name
+    prompt_path = PROMPT_DIR / file_name
     try:
         with open(prompt_path, 'r', encoding='utf-8') as f:
             return f.read()
@@ -46,54 +76,168 @@ def load_prompt(file_name: str) -> str:
         logger.error(f"Prompt file not found: {prompt_path}")
         return "" # Return empty string if prompt is missing
 
+# Warm the cache at import so no prompt file is read on the query path
+for _prompt_file in PROMPT_DIR.glob("*.md"):
+    load_prompt(_prompt_file.name)
+
+# --- Citations ---
+# The editor cites sources inline as [chunk_id]. The character class can't run
+# past a bracket, so unmatched brackets don't cause backtracking.
+_CITE_RE: Final[re.Pattern] = re.compile(r"\[([^\[\]]+)\]")
+
+def extract_citation_ids(response: str) -> list[str]:
+    """
+    Finds the chunk IDs cited in a final response.
+
+    Args:
+        response (str): The crew's final answer.
+
+    Returns:
+        list[str]: The cited IDs, without duplicates, in order of first citation.
+    """
+    return list(dict.fromkeys(m.group(1) for m in _CITE_RE.finditer(response)))
+
+
 # --- Tools ---
 # The tools are stateless, so they can be defined globally.
 query_tool = database_tools.query_database
+batch_query_tool = database_tools.query_database_batch
 citation_tool = database_tools.get_chunk_by_id
 
 
-# --- Main Execution Logic ---
+# --- Semantic Answer Cache ---
+# Final answers keyed by the model that wrote them and the embedding of the
+# query that produced them, so a paraphrase of an earlier question skips the
+# whole crew, but never returns another model's answer. The query vectors
+# come from the same txtai model that indexes the knowledge base; txtai
+# normalizes them, so a dot product is the cosine similarity. The cache is
+# emptied when the database on disk changes, since its answers cite chunks
+# of the old index.
+_answer_cache_vectors = deque(maxlen=main_config.SEMANTIC_CACHE_SIZE)
+_answer_cache_responses = deque(maxlen=main_config.SEMANTIC_CACHE_SIZE)
+_answer_cache_models = deque(maxlen=main_config.SEMANTIC_CACHE_SIZE)
+_answer_cache_index_mtime = None
+_answer_cache_lock = threading.Lock()
 
-def run_agentic_system(query: str, llm_client=None):
+def embed_query(query: str):
     """
-    Runs the full agentic system for a given query.
-    This function will handle routing and execute the appropriate crew.
-    It yields the output in a streaming fashion.
+    Embeds a query with the knowledge-base model. The database is never
+    loaded just for this; the research tools load it on their first search.
 
-    Args:
-        query (str): The user's query.
+    Returns:
+        The query vector, or None if the database (and its model) isn't loaded.
+    """
+    embeddings = database_tools.get_embeddings(load=False)
+    if embeddings is None:
+        return None
+    try:
+        return np.asarray(embeddings.transform(query), dtype=np.float32)
+    except Exception as e:
+        logger.warning(f"Could not embed query for the answer cache: {e}")
+        return None
 
-    Yields:
-        str: Chunks of the agent's output as they are generated.
+def get_model_key(llm_client) -> str:
     """
-    logger.info(f"Received query: {query}")
+    Identifies the model behind an LLM client for the answer cache. Clients
+    without a model name, such as test doubles, are keyed by their type.
+    """
+    return getattr(llm_client, "model_name", None) or type(llm_client).__qualname__
 
-    # --- LLM Setup ---
-    # If no LLM client is provided, create the default one.
-    # This allows for injecting a mock LLM during testing.
-    if llm_client is None:
-        logger.info("Initializing default LLM client.")
-        llm_client = ChatOpenAI(
-            base_url=main_config.LLM_API_ENDPOINT,
-            api_key=main_config.LLM_API_KEY,
-            model_name=main_config.LLM_MODEL_NAME
-        )
-
-    # --- Agent & Task Definitions (scoped to the run) ---
+def sync_answer_cache_with_index():
+    """
+    Empties the answer cache if the saved database changed since its answers
+    were cached.
+    """
+    global _answer_cache_index_mtime
+    index_mtime = database_tools.database_mtime()
+    with _answer_cache_lock:
+        if index_mtime != _answer_cache_index_mtime:
+            if _answer_cache_responses:
+                logger.info("Database changed; clearing the answer cache.")
+            _answer_cache_vectors.clear()
+            _answer_cache_responses.clear()
+            _answer_cache_models.clear()
+            _answer_cache_index_mtime = index_mtime
+
+def lookup_cached_answer(query_vector, model_key: str) -> str | None:
+    """
+    Returns the cached answer from the same model whose query is most similar
+    to the given one, if that similarity reaches SEMANTIC_CACHE_THRESHOLD.
+    """
+    with _answer_cache_lock:
+        if model_key not in _answer_cache_models:
+            return None
+        scores = np.stack(_answer_cache_vectors) @ query_vector
+        # Answers written by other models never count as a match
+        scores[np.array(_answer_cache_models) != model_key] = -np.inf
+        best = int(np.argmax(scores))
+        if scores[best] >= main_config.SEMANTIC_CACHE_THRESHOLD:
+            logger.info(f"Answer cache hit (similarity {scores[best]:.3f}).")
+            return _answer_cache_responses[best]
+    return None
+
+def store_cached_answer(query_vector, model_key: str, response: str):
+    """
+    Adds a final answer to the cache, evicting the oldest entry when full.
+    """
+    with _answer_cache_lock:
+        _answer_cache_vectors.append(query_vector)
+        _answer_cache_responses.append(response)
+        _answer_cache_models.append(model_key)
+
+
+# --- Crew Pool ---
+# Building agents, tasks and the crew (tool schemas, LLM binding) is a fixed
+# cost, so finished crews are kept per LLM client and reused by later queries.
+# A crew keeps per-run state in its tasks, so each one serves a single query
+# at a time: a query takes an idle crew, or builds a new one when all are
+# busy, and returns it when done. Task descriptions use a {query} placeholder
+# that kickoff() fills in each run. Entries keep a reference to their client
+# so its id() can't be recycled.
+_crew_pool: dict[int, tuple] = {}
+_crew_pool_lock = threading.Lock()
+_default_llm_client = None
+
+def get_default_llm_client():
+    """
+    Returns the process-wide default LLM client, creating it on first use.
+    """
+    global _default_llm_client
+    with _crew_pool_lock:
+        if _default_llm_client is None:
+            logger.info("Initializing default LLM client.")
+            _default_llm_client = ChatOpenAI(
+                base_url=main_config.LLM_API_ENDPOINT,
+                api_key=main_config.LLM_API_KEY,
+                model_name=main_config.LLM_MODEL_NAME
+            )
+        return _default_llm_client
+
+def build_research_crew(llm_client) -> Crew:
+    """
+    Builds the Researcher -> Analyst -> Editor crew bound to an LLM client.
+
+    Args:
+        llm_client: The LLM used by every agent in the crew.
+
+    Returns:
+        Crew: A crew whose tasks take the user's query as the 'query' input.
+    """
+    # --- Agent & Task Definitions ---
     researcher_agent = Agent(
         role="Researcher",
         goal=load_prompt("researcher.md"),
         backstory="You are a meticulous academic researcher...",
         llm=llm_client,
-        tools=[query_tool],
-        verbose=True,
+        tools=[query_tool, batch_query_tool],
+        verbose=VERBOSE,
     )
     analyst_agent = Agent(
         role="Analyst",
         goal=load_prompt("analyst.md"),
         backstory="You are a brilliant analyst...",
         llm=llm_client,
-        verbose=True,
+        verbose=VERBOSE,
     )
     editor_agent = Agent(
         role="Editor",
@@ -101,16 +245,16 @@ def run_agentic_system(query: str, llm_client=None):
         backstory="You are a professional editor...",
         llm=llm_client,
         tools=[citation_tool],
-        verbose=True,
+        verbose=VERBOSE,
     )
 
     research_task = Task(
-        description=f"Use your tools to find relevant information in the knowledge base to answer the user's query: '{query}'.",
+        description="Use your tools to find relevant information in the knowledge base to answer the user's query: '{query}'.",
         expected_output="A compilation of the most relevant text chunks...",
         agent=researcher_agent,
     )
     analysis_task = Task(
-        description=f"Analyze the information provided by the researcher and synthesize it into a comprehensive answer to the user's query: '{query}'.",
+        description="Analyze the information provided by the researcher and synthesize it into a comprehensive answer to the user's query: '{query}'.",
         expected_output="A detailed analysis of the researcher's findings...",
         agent=analyst_agent,
         context=[research_task],
@@ -123,22 +267,109 @@ def run_agentic_system(query: str, llm_client=None):
     )
 
     # --- Crew Definition ---
-    research_crew = Crew(
+    return Crew(
         agents=[researcher_agent, analyst_agent, editor_agent],
         tasks=[research_task, analysis_task, editing_task],
         process=Process.sequential,
-        verbose=2,
+        verbose=2 if VERBOSE else 0,
+        # The tool-result cache lives on the crew, so a pooled crew would
+        # replay one query's search results into later queries
+        cache=False,
     )
 
+def acquire_research_crew(llm_client) -> Crew:
+    """
+    Takes an idle crew for an LLM client from the pool, building a new one
+    if every pooled crew is in use.
+
+    Args:
+        llm_client: The LLM used by every agent in the crew.
+
+    Returns:
+        Crew: A crew reserved for the caller until it is released.
+    """
+    key = id(llm_client)
+    with _crew_pool_lock:
+        entry = _crew_pool.get(key)
+        if entry is None or entry[0] is not llm_client:
+            entry = (llm_client, [])
+            _crew_pool[key] = entry
+        if entry[1]:
+            return entry[1].pop()
+
+    # Built outside the lock so other queries aren't held up meanwhile
+    logger.info("Building research crew for LLM client.")
+    return build_research_crew(llm_client)
+
+def release_research_crew(llm_client, crew: Crew):
+    """
+    Returns a crew taken with acquire_research_crew to the pool.
+    """
+    with _crew_pool_lock:
+        entry = _crew_pool.get(id(llm_client))
+        if entry is not None and entry[0] is llm_client:
+            entry[1].append(crew)
+
+
+# --- Main Execution Logic ---
+
+def run_agentic_system(query: str, llm_client=None):
+    """
+    Runs the full agentic system for a given query.
+    This function will handle routing and execute the appropriate crew.
+    It yields the output in a streaming fashion.
+
+    Args:
+        query (str): The user's query.
+
+    Yields:
+        str: Chunks of the agent's output as they are generated.
+    """
+    logger.info(f"Received query: {query}")
+
+    # --- LLM Setup ---
+    # If no LLM client is provided, use the shared default one.
+    # This allows for injecting a mock LLM during testing.
+    if llm_client is None:
+        llm_client = get_default_llm_client()
+    model_key = get_model_key(llm_client)
+
+    # --- Answer Cache ---
+    # A near-duplicate of an earlier query to the same model is answered
+    # without running the crew
+    sync_answer_cache_with_index()
+    query_vector = embed_query(query)
+    if query_vector is not None:
+        cached_answer = lookup_cached_answer(query_vector, model_key)
+        if cached_answer is not None:
+            yield cached_answer
+            return
+
+    research_crew = acquire_research_crew(llm_client)
+
     # --- Execute the Crew ---
     logger.info("Executing the research crew.")
     inputs = {"query": query}
+    response_parts = []
     try:
-        result_stream = research_crew.kickoff(inputs=inputs)
+        # kickoff() returns the finished result, so the crew is free again
+        # as soon as it returns, even if the caller stops reading early
+        try:
+            result_stream = research_crew.kickoff(inputs=inputs)
+        finally:
+            release_research_crew(llm_client, research_crew)
         for token in result_stream:
+            response_parts.append(token)
             yield token
     except Exception as e:
         logger.error(f"An error occurred during crew execution: {e}", exc_info=True)
         yield f"An unexpected error occurred. Please check the logs for more details."
+    else:
+        # Only complete, successful answers are worth replaying. The crew's
+        # searches have loaded the database by now if it wasn't before.
+        if query_vector is None and response_parts:
+            query_vector = embed_query(query)
+        if query_vector is not None and response_parts:
+            store_cached_answer(query_vector, model_key, "".join(response_parts))
 
     logger.info("Crew execution finished.")
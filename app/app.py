@@ -1,23 +1,27 @@
 # app/app.py
 
 import streamlit as st
-import os
 import sys
-import re
 import csv
+import threading
+from datetime import datetime
 from pathlib import Path
+from typing import Final
 
 # --- Add project root to sys.path ---
 # This is crucial for ensuring the script can find top-level modules like `config` and `agents`
-project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-if project_root not in sys.path:
-    sys.path.insert(0, project_root)
+PROJECT_ROOT: Final[Path] = Path(__file__).resolve().parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+# --- Path Constants ---
+FEEDBACK_FILE: Final[Path] = PROJECT_ROOT / "logs/user_feedback.csv"
 
 # --- Imports from our project ---
 # It's good practice to keep these imports after the sys.path modification
 try:
-    from agents.agent_crew import run_agentic_system
-    from agents.tools.database_tools import get_chunk_by_id
+    from agents.agent_crew import enable_llm_cache, extract_citation_ids, run_agentic_system
+    from agents.tools.database_tools import get_chunks_by_ids
 except ImportError as e:
     st.error(f"Failed to import agent modules. Please ensure the project structure is correct and all dependencies are installed. Error: {e}")
     st.stop()
@@ -29,6 +33,17 @@ st.set_page_config(
     layout="wide"
 )
 
+# --- LLM Call Cache ---
+@st.cache_resource
+def init_llm_cache():
+    """
+    Enables the LLM call cache once per server process. Streamlit reruns this
+    script on every interaction, and reinstalling the cache would empty it.
+    """
+    enable_llm_cache()
+
+init_llm_cache()
+
 # --- Page Title and Header ---
 st.title("📚 Nexus Scholar: Your Private Research Assistant")
 st.write("This application allows you to chat with a crew of AI agents to get synthesized, cited answers from your document library.")
@@ -67,9 +82,12 @@ if prompt := st.chat_input("Ask a question about your documents..."):
 
     # --- Citation Handling ---
     # After the response, find all citations and prepare them for display
-    citation_ids = set(re.findall(r'\[(.*?)\]', full_response))
+    # All cited chunks are fetched with one database query and kept in the
+    # session, so reruns (e.g. toggling a source) don't query again
+    citation_ids = extract_citation_ids(full_response)
     if citation_ids:
         st.session_state.citations = {cid: False for cid in citation_ids}
+        st.session_state.citation_texts = get_chunks_by_ids(citation_ids)
 
 # --- Display Citations ---
 if "citations" in st.session_state and st.session_state.citations:
@@ -85,16 +103,30 @@ if "citations" in st.session_state and st.session_state.citations:
     for cid, is_visible in st.session_state.citations.items():
         if is_visible:
             with st.expander(f"Source: {cid}", expanded=True):
-                with st.spinner("Fetching source text..."):
-                    source_text = get_chunk_by_id(cid)
-                    st.markdown(source_text)
+                st.markdown(st.session_state.citation_texts[cid])
 
 # --- Feedback Handling ---
+FEEDBACK_HEADER: Final[list[str]] = ["timestamp", "query", "response", "feedback"]
+
+@st.cache_resource
+def get_feedback_writer():
+    """
+    Opens the feedback CSV once per server process and shares the handle
+    across sessions. Line buffering flushes every row as it is written.
+
+    Returns:
+        tuple: The csv writer and the lock that serializes writes to it.
+    """
+    FEEDBACK_FILE.parent.mkdir(parents=True, exist_ok=True)
+    f = open(FEEDBACK_FILE, 'a', newline='', buffering=1, encoding='utf-8')
+    writer = csv.writer(f)
+    # Append mode starts at the end of the file, so position 0 means it's new
+    if f.tell() == 0:
+        writer.writerow(FEEDBACK_HEADER)
+    return writer, threading.Lock()
+
 def log_feedback(feedback: str):
     """Logs the user's feedback to a CSV file."""
-    feedback_file = Path(project_root) / "logs/user_feedback.csv"
-    feedback_file.parent.mkdir(parents=True, exist_ok=True)
-
     # Get the last query and response from session state
     last_response = st.session_state.get("last_response", {})
     query = last_response.get("query", "N/A")
@@ -102,13 +134,8 @@ def log_feedback(feedback: str):
 
     # Write to CSV
     try:
-        file_exists = feedback_file.is_file()
-        with open(feedback_file, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            if not file_exists:
-                writer.writerow(["timestamp", "query", "response", "feedback"]) # Header
-
-            from datetime import datetime
+        writer, lock = get_feedback_writer()
+        with lock:
             writer.writerow([datetime.now().isoformat(), query, response, feedback])
 
         st.toast("Thank you for your feedback!", icon="✅")
@@ -1,7 +1,20 @@
 import os
-import requests
 import time
+import shutil
+import hashlib
+import uuid
+import requests
 import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# BLAKE3 hashes with SIMD at several GB/s; the standard library's BLAKE2b is
+# used for the response cache if it isn't installed.
+try:
+    from blake3 import blake3
+except ImportError:
+    blake3 = None
 
 # --- Configuration ---
 # This dictionary holds the default configuration values.
@@ -11,12 +24,49 @@ CONFIG = {
     "input_dir": "input_pdfs",   # Default folder for your PDF files
     "output_dir": "output_xml", # Default folder for the XML output
     "timeout_seconds": 60,       # Timeout for the request to GROBID
-    "force_reprocess": False   # Set to True to re-process files even if XML exists
+    "force_reprocess": False,  # Set to True to re-process files even if XML exists
+    "workers": 10,               # PDFs sent concurrently; matches GROBID's default `concurrency: 10`
+    "cache_dir": None            # Folder for XML cached by PDF content hash (None disables the cache)
 }
 
+# GROBID answers 503 when all of its worker slots are busy, without having
+# processed the document, so the upload is retried after a growing pause.
+BUSY_RETRIES = 5
+BUSY_BACKOFF_SECONDS = 2
+
+# The server check uses a short timeout and one retry after a short pause.
+PING_ATTEMPTS = 2
+PING_TIMEOUT_SECONDS = 1
+PING_RETRY_DELAY_SECONDS = 0.2
+
+# --- HTTP Session ---
+# A single session is shared by the server check and every upload, so HTTP
+# keep-alive reuses connections instead of opening one per request.
+_session = requests.Session()
+_session.headers["Connection"] = "keep-alive"
+
+def configure_session(pool_size: int):
+    """
+    Sizes the shared session's connection pool for the number of workers and
+    retries transient gateway errors. urllib3 only retries idempotent methods
+    on a bad status, so uploads are never resent after GROBID received them;
+    failed connection attempts are retried for every method.
+
+    Args:
+        pool_size (int): The number of connections kept open per host.
+    """
+    retries = Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retries)
+    _session.mount("http://", adapter)
+    _session.mount("https://", adapter)
+
 def check_grobid_server(url: str) -> bool:
     """
-    Checks if the GROBID server is running and accessible.
+    Checks if the GROBID server is running and accessible. A HEAD request with
+    a short timeout is enough to tell that the server answers; a connection
+    refused or reset, common just after the container starts, is retried once.
+    The ping bypasses the shared session, whose retrying adapter would
+    otherwise multiply the attempts and the wait.
 
     Args:
         url (str): The base URL of the GROBID server.
@@ -25,20 +75,146 @@ def check_grobid_server(url: str) -> bool:
         bool: True if the server is up, False otherwise.
     """
     ping_url = f"{url}/api/isalive"
-    try:
-        response = requests.get(ping_url, timeout=5)
-        if response.status_code == 200:
+    error = None
+    for attempt in range(PING_ATTEMPTS):
+        if attempt:
+            time.sleep(PING_RETRY_DELAY_SECONDS)
+        try:
+            response = requests.head(ping_url, timeout=PING_TIMEOUT_SECONDS)
+        except requests.exceptions.ConnectionError as e:
+            error = e
+            continue
+        except requests.exceptions.RequestException as e:
+            error = e
+            break
+
+        # 405 means the server is up but doesn't allow HEAD on this route
+        if response.status_code in (200, 405):
             print(f"✅ GROBID server is active at {url}")
             return True
-        else:
-            print(f"⚠️ GROBID server responded with status {response.status_code}. Check if it's running correctly.")
-            return False
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Could not connect to GROBID server at {url}.")
-        print(f"   Error: {e}")
-        print("   Please ensure the GROBID Docker container is running and the URL is correct.")
+        print(f"⚠️ GROBID server responded with status {response.status_code}. Check if it's running correctly.")
         return False
 
+    print(f"❌ Could not connect to GROBID server at {url}.")
+    print(f"   Error: {error}")
+    print("   Please ensure the GROBID Docker container is running and the URL is correct.")
+    return False
+
+# --- Response Cache ---
+# PDFs are read in 1 MB blocks for hashing to keep memory flat
+HASH_BLOCK_SIZE = 1 << 20
+
+def hash_pdf(pdf_path: str) -> str:
+    """
+    Computes the content hash that keys a PDF's cached XML.
+
+    Args:
+        pdf_path (str): Path to the PDF.
+
+    Returns:
+        str: The hexadecimal digest.
+    """
+    hasher = blake3() if blake3 is not None else hashlib.blake2b()
+    with open(pdf_path, 'rb') as f:
+        while block := f.read(HASH_BLOCK_SIZE):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def link_into_place(source_path: str, xml_path: str):
+    """
+    Hard-links a cached XML file to its output path, replacing any existing
+    file. Falls back to a copy when the cache is on another filesystem.
+    """
+    # Already linked; renaming a link over the same file would be a no-op
+    # that leaves the temporary link behind
+    if os.path.exists(xml_path) and os.path.samefile(source_path, xml_path):
+        return
+    # A name unique to this call, so concurrent links never share it
+    part_path = f"{xml_path}.{uuid.uuid4().hex}.part"
+    try:
+        try:
+            os.link(source_path, part_path)
+        except OSError:
+            shutil.copyfile(source_path, part_path)
+        os.replace(part_path, xml_path)
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+def process_pdf(api_url: str, pdf_path: str, xml_path: str, timeout: int, cache_dir: str | None = None) -> tuple[bool, str]:
+    """
+    Sends a single PDF to GROBID and writes the returned TEI/XML to disk.
+    With a cache directory, the XML is stored there under the PDF's content
+    hash and linked to the output path; a PDF whose content was already
+    processed, even under another name, is not sent again.
+
+    Args:
+        api_url (str): The GROBID full-text processing endpoint.
+        pdf_path (str): Path to the input PDF.
+        xml_path (str): Path where the XML output is written.
+        timeout (int): Request timeout in seconds.
+        cache_dir (str | None): The response cache directory, if enabled.
+
+    Returns:
+        tuple[bool, str]: Whether the PDF was converted, and a report of the
+                          outcome. The caller prints the report so that output
+                          from concurrent workers doesn't interleave.
+    """
+    filename = os.path.basename(pdf_path)
+    try:
+        cache_path = None
+        if cache_dir:
+            cache_path = os.path.join(cache_dir, f"{hash_pdf(pdf_path)}.xml")
+            if os.path.exists(cache_path):
+                link_into_place(cache_path, xml_path)
+                return True, f"{filename}\n  -> Cached! Linked XML to '{xml_path}'"
+
+        for attempt in range(BUSY_RETRIES + 1):
+            with open(pdf_path, 'rb') as pdf_file:
+                # The file is sent as multipart-form data
+                files = {'input': (filename, pdf_file, 'application/pdf', {'Expires': '0'})}
+
+                # Make the request to the GROBID API; the body is read as a stream
+                response = _session.post(api_url, files=files, timeout=timeout, stream=True)
+
+            if response.status_code != 503 or attempt == BUSY_RETRIES:
+                break
+            response.close()
+            time.sleep(BUSY_BACKOFF_SECONDS * (attempt + 1))
+
+        # --- Handle Response ---
+        with response:
+            if response.status_code == 200:
+                # Copy the XML to disk in 64 KB chunks instead of building the
+                # whole document as a string. A partial file is never left
+                # under the final name, where it would be skipped next run.
+                # The temporary file is unique to this call, since PDFs with
+                # the same content share a cache path and may run at once.
+                target_path = cache_path or xml_path
+                part_path = f"{target_path}.{uuid.uuid4().hex}.part"
+                try:
+                    with open(part_path, 'xb') as xml_f:
+                        xml_f.writelines(response.iter_content(chunk_size=1 << 16))
+                    os.replace(part_path, target_path)
+                finally:
+                    if os.path.exists(part_path):
+                        os.remove(part_path)
+                if cache_path:
+                    link_into_place(cache_path, xml_path)
+                return True, f"{filename}\n  -> Success! Saved XML to '{xml_path}'"
+            else:
+                # Handle API errors (e.g., bad request, server error)
+                return False, (f"{filename}\n  -> Error: GROBID returned status {response.status_code}\n"
+                               f"     Response: {response.text[:200]}...") # Print first 200 chars of error
+
+    except requests.exceptions.Timeout:
+        return False, (f"{filename}\n  -> Error: The request timed out after {timeout} seconds.\n"
+                       "     Consider increasing the timeout for very large or complex PDFs.")
+    except requests.exceptions.RequestException as e:
+        return False, f"{filename}\n  -> Error: A network error occurred: {e}"
+    except OSError as e:
+        return False, f"{filename}\n  -> Error: Could not read the PDF or write the XML: {e}"
+
 def process_directory(config: dict):
     """
     Processes all PDF files in the input directory and converts them to TEI/XML
@@ -52,6 +228,9 @@ def process_directory(config: dict):
     grobid_url = config["grobid_server_url"]
     api_url = f"{grobid_url}/api/processFulltextDocument"
 
+    workers = config["workers"]
+    configure_session(workers)
+
     # --- 1. Initial Checks ---
     if not check_grobid_server(grobid_url):
         return # Stop execution if server is not available
@@ -62,8 +241,13 @@ def process_directory(config: dict):
 
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
+    cache_dir = config["cache_dir"]
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
 
-    pdf_files = [f for f in os.listdir(input_dir) if f.lower().endswith(".pdf")]
+    # scandir entries carry their file type, so no extra stat per file is needed
+    with os.scandir(input_dir) as entries:
+        pdf_files = [e for e in entries if e.is_file() and e.name.lower().endswith(".pdf")]
 
     if not pdf_files:
         print(f"No PDF files found in '{input_dir}'.")
@@ -72,49 +256,50 @@ def process_directory(config: dict):
     print(f"\nFound {len(pdf_files)} PDF(s) to process. Starting conversion...")
     print("-" * 40)
 
-    # --- 2. Process Each PDF ---
-    for i, filename in enumerate(pdf_files):
-        pdf_path = os.path.join(input_dir, filename)
+    # --- 2. Collect the PDFs that still need processing ---
+    # One directory listing replaces a stat of every expected output file
+    with os.scandir(output_dir) as entries:
+        existing_xml = {e.name for e in entries if e.is_file()}
+
+    tasks = []
+    for entry in pdf_files:
+        filename, pdf_path = entry.name, entry.path
         xml_filename = os.path.splitext(filename)[0] + ".xml"
         xml_path = os.path.join(output_dir, xml_filename)
 
-        print(f"({i+1}/{len(pdf_files)}) Processing: {filename}")
-
         # Skip if the file has already been processed, unless force_reprocess is True
-        if not config["force_reprocess"] and os.path.exists(xml_path):
-            print("  -> Skipping, XML output already exists.")
+        if not config["force_reprocess"] and xml_filename in existing_xml:
+            print(f"Skipping {filename}, XML output already exists.")
             continue
+        tasks.append((pdf_path, xml_path))
 
-        try:
-            with open(pdf_path, 'rb') as pdf_file:
-                # The file is sent as multipart-form data
-                files = {'input': (filename, pdf_file, 'application/pdf', {'Expires': '0'})}
-                
-                # Make the request to the GROBID API
-                response = requests.post(api_url, files=files, timeout=config["timeout_seconds"])
-
-            # --- 3. Handle Response ---
-            if response.status_code == 200:
-                # Write the successful response content to the XML file
-                with open(xml_path, 'w', encoding='utf-8') as xml_f:
-                    xml_f.write(response.text)
-                print(f"  -> Success! Saved XML to '{xml_path}'")
-            else:
-                # Handle API errors (e.g., bad request, server error)
-                print(f"  -> Error: GROBID returned status {response.status_code}")
-                print(f"     Response: {response.text[:200]}...") # Print first 200 chars of error
-
-        except requests.exceptions.Timeout:
-            print(f"  -> Error: The request timed out after {config['timeout_seconds']} seconds.")
-            print("     Consider increasing the timeout for very large or complex PDFs.")
-        except requests.exceptions.RequestException as e:
-            print(f"  -> Error: A network error occurred: {e}")
-
-        # A small delay to be polite to the server, can be removed if not needed
-        time.sleep(1)
+    # --- 3. Process the PDFs concurrently ---
+    # One worker per GROBID processing slot keeps the server saturated. The
+    # workers share the session's pooled keep-alive connections.
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(process_pdf, api_url, pdf_path, xml_path, config["timeout_seconds"], cache_dir): pdf_path
+            for pdf_path, xml_path in tasks
+        }
+        for i, future in enumerate(as_completed(futures)):
+            filename = os.path.basename(futures[future])
+            try:
+                success, report = future.result()
+            except Exception as e:
+                # One bad file must not abort the run and lose the summary
+                success, report = False, f"❌ Unexpected error while processing {filename}: {e}"
+            print(f"({i+1}/{len(tasks)}) {report}")
+            if not success:
+                failed.append(filename)
 
     print("-" * 40)
-    print("✅ Processing complete.")
+    if failed:
+        print(f"⚠️ Processing complete. {len(tasks) - len(failed)} succeeded, {len(failed)} failed:")
+        for filename in sorted(failed):
+            print(f"   - {filename}")
+    else:
+        print("✅ Processing complete.")
 
 
 if __name__ == "__main__":
@@ -130,6 +315,11 @@ if __name__ == "__main__":
                         help=f"URL of the GROBID server. (Default: {CONFIG['grobid_server_url']})")
     parser.add_argument("--force", dest="force_reprocess", action="store_true",
                         help="Force reprocessing of all PDFs, even if output XML already exists.")
+    parser.add_argument("--workers", type=int, default=CONFIG["workers"],
+                        help=f"Number of PDFs to send to GROBID concurrently; match the server's `concurrency` setting. (Default: {CONFIG['workers']})")
+    parser.add_argument("--cache-dir", dest="cache_dir", default=CONFIG["cache_dir"],
+                        help="Directory for XML cached by PDF content. Renamed or re-processed PDFs whose content "
+                             "is already cached are linked from it instead of being sent to GROBID. (Default: disabled)")
 
     args = parser.parse_args()
 
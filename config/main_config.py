@@ -31,8 +31,40 @@ DATABASE_PATH = "2_database/db/txtai_index"
 # The sentence-transformer model to use for generating embeddings.
 # 'all-MiniLM-L6-v2' is a good, lightweight default.
 SENTENCE_TRANSFORMER_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# The txtai ANN backend used when a new index is created. 'faiss' is txtai's
+# default. 'numpy' is an exact, brute-force scan, which suits a personal paper
+# library; when the optional `simsimd` package is installed its scoring runs on
+# SIMD kernels, and QUANT_DTYPE below applies. 'hnsw' (requires `hnswlib`)
+# builds an approximate graph index whose search time grows logarithmically,
+# for libraries of hundreds of thousands of chunks.
+ANN_BACKEND = "faiss"
+# Backend-specific build settings, keyed by backend name. For HNSW, a larger
+# 'efconstruction' and 'm' give better recall at the cost of build time and memory.
+ANN_CONFIG = {"hnsw": {"efconstruction": 200, "m": 32}}
+# HNSW search breadth at query time; raise it if agents use a large top_k.
+ANN_EF_SEARCH = 64
+# Precision of the candidate scan for NumPy-backed indexes at query time:
+# 'fp32' (exact), 'fp16' / 'bf16' (half precision, fastest on CPUs with native
+# FP16/BF16 dot products such as Apple Silicon or Sapphire Rapids), 'i8' (int8
+# cosine) or 'b1' (1-bit Hamming). Reduced-precision modes require `simsimd`;
+# the top QUANT_RERANK_FACTOR * top_k candidates are then re-scored with the
+# full-precision vectors.
+QUANT_DTYPE = "fp32"
+QUANT_RERANK_FACTOR = 4
+
+
+# --- Answer Cache Configuration ---
+# Final crew answers are cached in memory and reused for paraphrased queries.
+# Minimum cosine similarity between query embeddings to count as a cache hit.
+SEMANTIC_CACHE_THRESHOLD = 0.95
+# Maximum number of cached answers; the oldest entries are evicted first.
+SEMANTIC_CACHE_SIZE = 256
+# Maximum number of individual LLM calls kept in the in-memory LLM call cache
+# enabled by the app; the oldest entries are evicted first.
+LLM_CACHE_SIZE = 1024
 
 
 # --- Application Behavior ---
-# Set to True to enable verbose logging for debugging purposes
-VERBOSE_LOGGING = True
+# Set to True to enable verbose logging for debugging purposes. This includes
+# INFO-level logs and CrewAI's step-by-step agent output.
+VERBOSE_LOGGING = False
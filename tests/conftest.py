@@ -0,0 +1,62 @@
+# tests/conftest.py
+
+import pytest
+from unittest.mock import patch
+
+from agents.tools import database_tools
+from tests.mocks.fake_embeddings import FakeEmbeddings
+
+# --- Shared Models ---
+@pytest.fixture(scope="session")
+def txtai_models():
+    """
+    A txtai models cache shared by every index built during the session.
+    txtai stores each vectors model in it by path on first load, so later
+    indexes with the same model reuse the loaded copy instead of reading
+    the weights and building the network again.
+    """
+    return {}
+
+
+# --- Pytest Fixtures for the Test Database ---
+@pytest.fixture(scope="session")
+def setup_test_database(tmp_path_factory, txtai_models):
+    """
+    A session-scoped fixture that builds the real test database once.
+    Only tests that need real model embeddings should request it.
+    """
+    # We need to import the setup script and run its main function
+    from tests import setup_test_db
+
+    # Temporarily change the output directory to a pytest-managed temp dir
+    # This prevents cluttering the project with a 'tests/temp_db' folder
+    temp_db_path = tmp_path_factory.mktemp("temp_db")
+
+    # Use monkeypatch to override the DB_OUTPUT_DIR in the setup script
+    with patch.object(setup_test_db, 'DB_OUTPUT_DIR', temp_db_path):
+        embeddings = setup_test_db.build_test_database(models=txtai_models)
+
+    # Yield the built index; it is shared, read-only, by every test
+    yield embeddings
+
+
+@pytest.fixture(scope="session")
+def mock_db_embeddings():
+    """
+    A fake index over the test database's documents, built once per session.
+    It uses deterministic hash vectors instead of a model, so nothing is
+    loaded or encoded. Tests must only search it, never index into it.
+    """
+    from tests import setup_test_db
+
+    return FakeEmbeddings(setup_test_db.load_test_documents())
+
+
+@pytest.fixture(scope="function")
+def patch_db_path(monkeypatch, mock_db_embeddings):
+    """
+    A function-scoped fixture to point the tools module at the test database.
+    This ensures each test runs with a clean patch.
+    """
+    # Patch the global embeddings object in the tools module
+    monkeypatch.setattr(database_tools, "embeddings", mock_db_embeddings)
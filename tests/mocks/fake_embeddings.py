@@ -0,0 +1,113 @@
+# tests/mocks/fake_embeddings.py
+
+import hashlib
+import re
+
+import numpy as np
+
+# Number of dimensions of the fake vectors
+DIMENSIONS = 32
+
+_TOKEN_RE = re.compile(r"\w+")
+_SELECT_RE = re.compile(r"^\s*select\s+(.+?)\s+from\s", re.IGNORECASE | re.DOTALL)
+_ID_FILTER_RE = re.compile(r"\bwhere\s+id\s*(=|in\b)", re.IGNORECASE)
+
+# Columns txtai returns when a query has no SELECT clause
+_DEFAULT_COLUMNS = ("id", "text", "score")
+
+
+def _token_vector(token: str) -> np.ndarray:
+    """
+    Maps a token to a fixed pseudo-random vector derived from its hash.
+    """
+    digest = hashlib.blake2s(token.encode("utf-8"), digest_size=DIMENSIONS).digest()
+    return np.frombuffer(digest, dtype=np.uint8).astype(np.float32) - 127.5
+
+
+class FakeEmbeddings:
+    """
+    A deterministic stand-in for a txtai Embeddings index with a content store.
+    This class mimics the subset of the txtai API used by the database tools,
+    but needs no model: a text's vector is the normalized sum of per-token
+    hash vectors, so texts sharing words score higher.
+
+    Supported queries:
+        - A plain text query, or "SELECT <columns> FROM txtai WHERE
+          similar(:query)" with the text bound as a parameter.
+        - "SELECT <columns> FROM txtai WHERE id = :id" or "WHERE id IN
+          (:id0, ...)", with the IDs bound as parameters.
+    """
+    def __init__(self, documents: list[dict] | None = None):
+        """
+        Args:
+            documents (list[dict] | None): Documents to index, each with an
+                'id', a 'text' and any extra fields to store.
+        """
+        self.documents = {}
+        self._ids = []
+        self._vectors = np.zeros((0, DIMENSIONS), dtype=np.float32)
+        if documents:
+            self.index(documents)
+
+    def transform(self, text: str) -> np.ndarray:
+        """
+        Mimics Embeddings.transform: returns the text's normalized vector.
+        """
+        vector = np.zeros(DIMENSIONS, dtype=np.float32)
+        for token in _TOKEN_RE.findall(text.lower()):
+            vector += _token_vector(token)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def index(self, documents: list[dict]):
+        """
+        Mimics Embeddings.index: replaces the index with the given documents.
+        """
+        self.documents = {doc["id"]: dict(doc) for doc in documents}
+        self._ids = list(self.documents)
+        self._vectors = np.array(
+            [self.transform(doc["text"]) for doc in self.documents.values()], dtype=np.float32
+        ).reshape(-1, DIMENSIONS)
+
+    def count(self) -> int:
+        """
+        Mimics Embeddings.count.
+        """
+        return len(self._ids)
+
+    def search(self, query: str, limit: int = 3, parameters: dict | None = None) -> list[dict]:
+        """
+        Mimics Embeddings.search for the supported queries.
+        """
+        return self.batchsearch([query], limit, [parameters] if parameters else None)[0]
+
+    def batchsearch(self, queries: list[str], limit: int = 3, parameters: list[dict] | None = None) -> list[list[dict]]:
+        """
+        Mimics Embeddings.batchsearch for the supported queries.
+        """
+        return [
+            self._query(query, limit, parameters[x] if parameters else None)
+            for x, query in enumerate(queries)
+        ]
+
+    def _query(self, query: str, limit: int, parameters: dict | None) -> list[dict]:
+        """
+        Runs a single query and returns rows with txtai's column selection.
+        """
+        select = _SELECT_RE.match(query)
+        columns = [c.strip() for c in select.group(1).split(",")] if select else _DEFAULT_COLUMNS
+
+        if select and _ID_FILTER_RE.search(query):
+            # Primary-key lookup; every bound parameter is a requested ID
+            hits = [(doc_id, None) for doc_id in dict.fromkeys((parameters or {}).values()) if doc_id in self.documents]
+        else:
+            text = parameters["query"] if select else query
+            scores = self._vectors @ self.transform(text)
+            order = np.argsort(-scores, kind="stable")
+            hits = [(self._ids[i], float(scores[i])) for i in order]
+
+        rows = []
+        for doc_id, score in hits[:limit]:
+            values = {**self.documents[doc_id], "score": score}
+            rows.append({column: values.get(column) for column in columns})
+        return rows
@@ -1,5 +1,11 @@
 # tests/mocks/mock_llm.py
 
+import sys
+
+# The single response returned by every MockLLM call. Tests can compare
+# against this constant instead of repeating the literal.
+MOCK_RESPONSE = sys.intern("This is a mock LLM response to the prompt.")
+
 class MockLLM:
     """
     A mock LLM class for testing purposes.
@@ -26,10 +32,10 @@ class MockLLM:
         # In a more advanced mock, you could have logic here to return
         # different responses based on the prompt content.
         # For now, a simple, consistent response is sufficient.
-        return "This is a mock LLM response to the prompt."
+        return MOCK_RESPONSE
 
     def __call__(self, prompt: str, *args, **kwargs) -> str:
         """
         Some LangChain components might use the __call__ method as an alias for invoke.
         """
-        return self.invoke(prompt, *args, **kwargs)
+        return MOCK_RESPONSE
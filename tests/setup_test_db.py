@@ -9,27 +9,20 @@ TEST_DATA_DIR = Path(__file__).parent / "test_data"
 SOURCE_MD_FILE = TEST_DATA_DIR / "sample_doc.md"
 DB_OUTPUT_DIR = Path(__file__).parent / "temp_db"
 
-def build_test_database():
+def load_test_documents() -> list[dict]:
     """
-    Builds a small txtai index from the sample markdown file for testing purposes.
-    """
-    print("--- Building Test Database ---")
-
-    if not SOURCE_MD_FILE.is_file():
-        print(f"Error: Source markdown file not found at {SOURCE_MD_FILE}")
-        return
-
-    # Ensure the output directory exists
-    DB_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
-    print(f"Output directory: {DB_OUTPUT_DIR}")
+    Loads the documents the test database is built from.
 
+    Returns:
+        list[dict]: The chunks to index, each with an 'id', 'text' and
+                    'source_filename'.
+    """
     # Read the content of the markdown file
     with open(SOURCE_MD_FILE, 'r', encoding='utf-8') as f:
         content = f.read()
 
-    # Create a list of dictionaries to index.
     # We'll treat the whole document as a single chunk for this simple test DB.
-    data_to_index = [
+    return [
         {
             "id": "sample_doc_chunk_001",
             "text": content,
@@ -37,11 +30,47 @@ def build_test_database():
         }
     ]
 
+def build_test_database(models: dict | None = None):
+    """
+    Builds a small txtai index from the sample markdown file for testing purposes.
+
+    Args:
+        models (dict | None): A txtai models cache. Indexes created with the
+                              same dict share one loaded copy of each model.
+
+    Returns:
+        Embeddings | None: The built index, which callers can keep using
+                           instead of loading it back from disk, or None if
+                           the build failed.
+    """
+    print("--- Building Test Database ---")
+
+    if not SOURCE_MD_FILE.is_file():
+        print(f"Error: Source markdown file not found at {SOURCE_MD_FILE}")
+        return
+
+    # Ensure the output directory exists
+    DB_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+    print(f"Output directory: {DB_OUTPUT_DIR}")
+
+    data_to_index = load_test_documents()
+
     # Create and save the embeddings index
     try:
         print("Initializing embeddings model...")
-        # Using a default, lightweight model for testing
-        embeddings = Embeddings(content=True, path="sentence-transformers/all-MiniLM-L6-v2")
+        # Using a 3-layer MiniLM, about twice as fast as the 6-layer production
+        # model; the tests check retrieval plumbing, not embedding quality.
+        # All chunks are encoded in batched forward passes of up to 64.
+        # The content store stays on, since the tools look chunks up with SQL,
+        # but the ANN index is a plain NumPy matrix, like the production
+        # default, instead of a Faiss index.
+        embeddings = Embeddings(
+            models=models,
+            content=True,
+            path="sentence-transformers/paraphrase-MiniLM-L3-v2",
+            encodebatch=64,
+            backend="numpy"
+        )
 
         print(f"Indexing {len(data_to_index)} document(s)...")
         embeddings.index(data_to_index)
@@ -51,6 +80,7 @@ def build_test_database():
         embeddings.save(str(db_save_path))
 
         print("✅ Test database built successfully.")
+        return embeddings
     except Exception as e:
         print(f"❌ An error occurred while building the test database: {e}")
 
@@ -1,17 +1,17 @@
 import pytest
+from collections import deque
 from unittest.mock import patch
 
 # --- Modules to be tested and mocked ---
 # This assumes directories have been renamed (e.g., '3_agents' -> 'agents')
 from agents import agent_crew
 from agents.tools import database_tools
-from tests.mocks.mock_llm import MockLLM
+from tests.mocks.fake_embeddings import FakeEmbeddings
+from tests.mocks.mock_llm import MockLLM, MOCK_RESPONSE
 
 # --- Test Fixture ---
-# We reuse the session-scoped database setup from test_tools
-# and the function-scoped patcher to point the tools to the test DB.
-# This assumes pytest is run on the whole 'tests' directory, so the session fixture is available.
-from .test_tools import setup_test_database, patch_db_path
+# The session-scoped test database and the function-scoped `patch_db_path`
+# fixture that points the tools at it are provided by conftest.py.
 
 
 # --- Test for the Agent Crew ---
@@ -44,4 +44,148 @@ def test_agent_crew_execution_with_mocks(patch_db_path):
     # The most important thing to assert is that the output is the
     # hardcoded response from our MockLLM. This proves that the mock
     # was successfully injected and that the crew executed without crashing.
-    assert full_response == "This is a mock LLM response to the prompt."
+    assert full_response == MOCK_RESPONSE
+
+def test_pooled_crew_runs_each_query(patch_db_path, monkeypatch):
+    """
+    Tests that a crew reused from the pool fills each run's task
+    descriptions with that run's query, not an earlier one.
+    """
+    monkeypatch.setattr(agent_crew, "_crew_pool", {})
+    monkeypatch.setattr(agent_crew, "embed_query", lambda query: None)
+
+    # Record which crew ran and its task descriptions after each kickoff
+    runs = []
+    real_kickoff = agent_crew.Crew.kickoff
+    def recording_kickoff(crew, inputs=None):
+        result = real_kickoff(crew, inputs=inputs)
+        runs.append((crew, [task.description for task in crew.tasks]))
+        return result
+    monkeypatch.setattr(agent_crew.Crew, "kickoff", recording_kickoff)
+
+    mock_llm = MockLLM()
+    first_query = "What is the key component of the system?"
+    second_query = "How is the system evaluated?"
+    "".join(agent_crew.run_agentic_system(first_query, llm_client=mock_llm))
+    "".join(agent_crew.run_agentic_system(second_query, llm_client=mock_llm))
+
+    (first_crew, first_descriptions), (second_crew, second_descriptions) = runs
+    assert second_crew is first_crew
+    assert first_crew.cache is False
+    assert any(first_query in description for description in first_descriptions)
+    assert any(second_query in description for description in second_descriptions)
+    assert not any(first_query in description for description in second_descriptions)
+
+
+# --- Tests for Citation Parsing ---
+
+def test_extract_citation_ids():
+    """
+    Tests that cited chunk IDs are found once each, in order of first
+    citation, and that a stray '[' doesn't swallow the next citation.
+    """
+    response = (
+        "Claim one [doc_a_chunk_001]. Claim two [doc_b_chunk_002][doc_a_chunk_001]. "
+        "An unclosed [bracket before [doc_c_chunk_003]."
+    )
+
+    assert agent_crew.extract_citation_ids(response) == [
+        "doc_a_chunk_001", "doc_b_chunk_002", "doc_c_chunk_003"
+    ]
+
+def test_extract_citation_ids_split_across_tokens():
+    """
+    Tests that a citation split across stream tokens is found, since the
+    IDs are parsed from the complete response.
+    """
+    tokens = ["See [doc_a_ch", "unk_001", "] and [", "doc_b_chunk_002]."]
+
+    assert agent_crew.extract_citation_ids("".join(tokens)) == ["doc_a_chunk_001", "doc_b_chunk_002"]
+
+def test_extract_citation_ids_none():
+    """
+    Tests a response without citations.
+    """
+    assert agent_crew.extract_citation_ids("No sources were cited.") == []
+
+
+
+# --- Tests for the Semantic Answer Cache ---
+
+@pytest.fixture
+def answer_cache(monkeypatch):
+    """
+    Gives each test an empty answer cache that holds two entries, and a
+    FakeEmbeddings to embed its queries with.
+    """
+    for name in ("_answer_cache_vectors", "_answer_cache_responses", "_answer_cache_models"):
+        monkeypatch.setattr(agent_crew, name, deque(maxlen=2))
+    monkeypatch.setattr(agent_crew, "_answer_cache_index_mtime", None)
+    return FakeEmbeddings()
+
+def test_answer_cache_threshold(answer_cache, monkeypatch):
+    """
+    Tests that a cached answer is returned only when the query similarity
+    reaches SEMANTIC_CACHE_THRESHOLD.
+    """
+    cached = answer_cache.transform("what is semantic caching in retrieval systems")
+    paraphrase = answer_cache.transform("what is semantic caching")
+    similarity = float(cached @ paraphrase)
+    agent_crew.store_cached_answer(cached, "model-a", "cached answer")
+
+    monkeypatch.setattr(agent_crew.main_config, "SEMANTIC_CACHE_THRESHOLD", similarity + 0.01)
+    assert agent_crew.lookup_cached_answer(paraphrase, "model-a") is None
+
+    monkeypatch.setattr(agent_crew.main_config, "SEMANTIC_CACHE_THRESHOLD", similarity - 0.01)
+    assert agent_crew.lookup_cached_answer(paraphrase, "model-a") == "cached answer"
+
+def test_answer_cache_keyed_by_model(answer_cache):
+    """
+    Tests that an answer is only returned for the model that wrote it.
+    """
+    vector = answer_cache.transform("what is semantic caching")
+    agent_crew.store_cached_answer(vector, "model-a", "answer from a")
+
+    assert agent_crew.lookup_cached_answer(vector, "model-b") is None
+
+    agent_crew.store_cached_answer(vector, "model-b", "answer from b")
+    assert agent_crew.lookup_cached_answer(vector, "model-a") == "answer from a"
+    assert agent_crew.lookup_cached_answer(vector, "model-b") == "answer from b"
+
+def test_answer_cache_evicts_oldest(answer_cache):
+    """
+    Tests that the oldest answer is evicted once the cache is full.
+    """
+    queries = ["first question", "second question", "third question"]
+    for query in queries:
+        agent_crew.store_cached_answer(answer_cache.transform(query), "model-a", f"answer to {query}")
+
+    assert agent_crew.lookup_cached_answer(answer_cache.transform(queries[0]), "model-a") is None
+    assert agent_crew.lookup_cached_answer(answer_cache.transform(queries[2]), "model-a") == "answer to third question"
+
+def test_answer_cache_cleared_when_database_changes(answer_cache, monkeypatch):
+    """
+    Tests that cached answers are dropped once the saved database changes.
+    """
+    vector = answer_cache.transform("what is semantic caching")
+    monkeypatch.setattr(database_tools, "database_mtime", lambda: 100.0)
+    agent_crew.sync_answer_cache_with_index()
+    agent_crew.store_cached_answer(vector, "model-a", "cached answer")
+
+    # An unchanged database keeps the cache
+    agent_crew.sync_answer_cache_with_index()
+    assert agent_crew.lookup_cached_answer(vector, "model-a") == "cached answer"
+
+    monkeypatch.setattr(database_tools, "database_mtime", lambda: 200.0)
+    agent_crew.sync_answer_cache_with_index()
+    assert agent_crew.lookup_cached_answer(vector, "model-a") is None
+
+def test_embed_query_does_not_load_database(monkeypatch):
+    """
+    Tests that embedding a query for the cache never loads the database.
+    """
+    monkeypatch.setattr(database_tools, "embeddings", database_tools._NOT_LOADED)
+    monkeypatch.setattr(database_tools, "_load_database", lambda: pytest.fail("database was loaded"))
+
+    assert agent_crew.embed_query("what is semantic caching") is None
+    assert database_tools.embeddings is database_tools._NOT_LOADED
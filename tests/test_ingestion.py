@@ -1,6 +1,8 @@
 import pytest
 from unittest.mock import MagicMock, patch
-import json
+import orjson
+import jsonschema
+from pathlib import Path
 
 # --- Module to be tested ---
 # This import assumes the directory has been renamed from '1_ingestion' to 'ingestion'
@@ -8,8 +10,10 @@ from ingestion import ingest_pipeline
 from tests.mocks.mock_llm import MockLLM
 
 # --- Mock Data ---
+SAMPLE_XML_FILE = Path(__file__).parent / "test_data/sample.xml"
+
 MOCK_XML_CONTENT = """
-<TEI>
+<TEI xmlns="http://www.tei-c.org/ns/1.0">
     <teiHeader>
         <fileDesc>
             <titleStmt><title>Mock Paper Title</title></titleStmt>
@@ -35,60 +39,86 @@ MOCK_LLM_RESPONSE = {
     "entities": ["mocking", "testing", "pytest"]
 }
 
+# Shape of a processed document JSON. The validator is built once for the module.
+PROCESSED_DOCUMENT_SCHEMA = {
+    "type": "object",
+    "required": ["source_filename", "document_summary", "key_entities", "chunks", "processed_timestamp"],
+    "properties": {
+        "source_filename": {"type": "string", "pattern": r"\.pdf$"},
+        "document_summary": {"type": "string", "minLength": 1},
+        "key_entities": {"type": "array", "items": {"type": "string"}},
+        "chunks": {"type": "array", "minItems": 1, "items": {"type": "string", "minLength": 1}},
+        "pdf_sha256": {"type": ["string", "null"], "pattern": "^[0-9a-f]{64}$"},
+        "processed_timestamp": {"type": "number"},
+    },
+}
+_SCHEMA_VALIDATOR = jsonschema.Draft202012Validator(PROCESSED_DOCUMENT_SCHEMA)
+
+# --- Test Configuration ---
+# Settings patched onto the pipeline's config modules for each test. The
+# pipeline reads them at call time, so the module never needs reloading.
+# Paths are relative to the test's temporary directory.
+MOCK_INGEST_PATHS = {
+    "PDF_SOURCE_DIR": "ingestion/source_documents/pdfs",
+    "MD_CLEANED_DIR": "ingestion/source_documents/cleaned_md",
+    "QUARANTINED_DIR": "ingestion/source_documents/quarantined",
+    "PROCESSED_DATA_DIR": "ingestion/processed_data",
+    "PROCESSED_HASHES_FILE": "ingestion/processed_hashes.json",
+}
+MOCK_INGEST_CONFIG = {
+    "GROBID_SERVER_URL": "http://mock-grobid:8070",
+    "GROBID_TIMEOUT": 10,
+    "GROBID_CONCURRENCY": 2,
+    "LLM_CONCURRENCY": 1,
+    "IN_MEMORY_PDF_MAX": 32 * 1024 * 1024,
+    "FORCE_REPROCESS_PDF": True, # Forcing for tests
+    "KEEP_CLEANED_MD": False,
+}
+MOCK_MAIN_CONFIG = {
+    "LLM_API_ENDPOINT": "http://mock-llm-server/v1",
+    "LLM_MODEL_NAME": "mock-model",
+    "LLM_API_KEY": "not-required",
+    "LLM_TIMEOUT": 10,
+    "LLM_MAX_TOKENS": 1024,
+    "CHUNK_METHOD": "sentences",
+    "CHUNK_SIZE": 100,
+    "CHUNK_OVERLAP": 20,
+}
+
 @pytest.fixture
-def mock_fs(fs):
+def mock_fs(tmp_path, monkeypatch):
     """
-    Sets up a fake file system using pyfakefs for testing.
-    'fs' is a fixture provided by the pyfakefs library.
+    Sets up the pipeline's directory layout in a temporary directory and
+    points the pipeline's configuration at it.
+    'tmp_path' is pytest's built-in per-test temporary directory.
     """
     # Create necessary source directories
-    fs.create_dir("/app/ingestion/source_documents/pdfs")
-    fs.create_dir("/app/ingestion/source_documents/quarantined")
-    fs.create_dir("/app/ingestion/processed_data")
-    fs.create_dir("/app/ingestion/source_documents/xml_output") # The pipeline uses this temp dir
-    fs.create_dir("/app/ingestion/source_documents/cleaned_md") # The pipeline uses this temp dir
-    fs.create_dir("/app/logs")
+    for name in ("PDF_SOURCE_DIR", "MD_CLEANED_DIR", "QUARANTINED_DIR", "PROCESSED_DATA_DIR"):
+        (tmp_path / MOCK_INGEST_PATHS[name]).mkdir(parents=True)
 
     # Create a dummy PDF file to be "processed"
-    fs.create_file("/app/ingestion/source_documents/pdfs/test_paper.pdf", contents="dummy pdf content")
+    (tmp_path / MOCK_INGEST_PATHS["PDF_SOURCE_DIR"] / "test_paper.pdf").write_bytes(b"dummy pdf content")
 
-    # Create mock config files that the pipeline will read
-    # We need to provide dummy values for the paths used by the pipeline
-    # The 'ingest_config' object in the pipeline is loaded from 'ingestion/config.py'
-    fs.create_file("/app/ingestion/config.py", contents="""
-from pathlib import Path
-BASE_DIR = Path('/app')
-PDF_SOURCE_DIR = BASE_DIR / "ingestion/source_documents/pdfs"
-MD_CLEANED_DIR = BASE_DIR / "ingestion/source_documents/cleaned_md"
-QUARANTINED_DIR = BASE_DIR / "ingestion/source_documents/quarantined"
-PROCESSED_DATA_DIR = BASE_DIR / "ingestion/processed_data"
-XML_OUTPUT_DIR = BASE_DIR / "ingestion/source_documents/xml_output"
-LOG_FILE = BASE_DIR / "logs/ingestion.log"
-GROBID_SERVER_URL = "http://mock-grobid:8070"
-GROBID_TIMEOUT = 10
-FORCE_REPROCESS_PDF = True # Forcing for tests
-""")
-
-    fs.create_file("/app/config/main_config.py", contents="""
-LLM_API_ENDPOINT = "http://mock-llm-server/v1"
-LLM_MODEL_NAME = "mock-model"
-LLM_API_KEY = "not-required"
-LLM_TIMEOUT = 10
-LLM_MAX_TOKENS = 1024
-CHUNK_METHOD = "sentences"
-CHUNK_SIZE = 100
-CHUNK_OVERLAP = 20
-VERBOSE_LOGGING = True
-""")
-
-    fs.create_file("/app/ingestion/prompts.py", contents="""
-VALIDATION_ENRICHMENT_PROMPT = "mock prompt: {markdown_text}"
-""")
-
-    yield fs
-
-
-@patch('ingestion.ingest_pipeline.requests.post')
+    # Patch the settings the pipeline reads from its config modules
+    for name, relative_path in MOCK_INGEST_PATHS.items():
+        monkeypatch.setattr(ingest_pipeline.ingest_config, name, tmp_path / relative_path)
+    for name, value in MOCK_INGEST_CONFIG.items():
+        monkeypatch.setattr(ingest_pipeline.ingest_config, name, value)
+    for name, value in MOCK_MAIN_CONFIG.items():
+        monkeypatch.setattr(ingest_pipeline.main_config, name, value)
+    monkeypatch.setattr(ingest_pipeline.prompts, "VALIDATION_ENRICHMENT_PROMPT", "mock prompt: <<MARKDOWN_TEXT>>")
+
+    # The text splitter is built lazily from the chunking settings; drop any
+    # instance a previous test built so the patched settings take effect
+    monkeypatch.setattr(ingest_pipeline, "_SPLITTER", None)
+
+    # There is no GROBID server in tests; report it as up so main() proceeds
+    monkeypatch.setattr(ingest_pipeline, "check_grobid_server", lambda url: True)
+
+    yield tmp_path
+
+
+@patch('ingestion.ingest_pipeline._GROBID_SESSION.post')
 @patch('ingestion.ingest_pipeline.ChatOpenAI')
 def test_ingestion_pipeline_success(mock_chat_openai, mock_post, mock_fs):
     """
@@ -99,45 +129,41 @@ def test_ingestion_pipeline_success(mock_chat_openai, mock_post, mock_fs):
     # Mock the GROBID API call
     mock_grobid_response = MagicMock()
     mock_grobid_response.status_code = 200
-    mock_grobid_response.text = MOCK_XML_CONTENT
+    mock_grobid_response.content = MOCK_XML_CONTENT.encode('utf-8')
     mock_post.return_value = mock_grobid_response
 
     # Mock the LLM response by having ChatOpenAI return our MockLLM instance
     mock_llm_instance = MockLLM()
     # Our MockLLM needs to return a JSON string, just like the real one would
-    mock_llm_instance.invoke = MagicMock(return_value=json.dumps(MOCK_LLM_RESPONSE))
+    mock_llm_instance.invoke = MagicMock(return_value=orjson.dumps(MOCK_LLM_RESPONSE).decode())
     mock_chat_openai.return_value = mock_llm_instance
 
     # --- Run the pipeline ---
-    # We need to reload the modules to use the fake file system
-    import importlib
-    importlib.reload(ingest_pipeline)
     ingest_pipeline.main()
 
     # --- Assertions ---
     # 1. Check that the final JSON file was created
-    processed_files = list(mock_fs.glob("/app/ingestion/processed_data/*.json"))
+    processed_files = list((mock_fs / "ingestion/processed_data").glob("*.json"))
     assert len(processed_files) == 1
 
     # 2. Check the content of the JSON file
-    with open(processed_files[0], 'r') as f:
-        data = json.load(f)
+    data = orjson.loads(processed_files[0].read_bytes())
+    _SCHEMA_VALIDATOR.validate(data)
 
     assert data["source_filename"] == "test_paper.pdf"
     assert data["document_summary"] == "This is a mock summary of the paper."
     assert "testing" in data["key_entities"]
-    assert len(data["chunks"]) > 0
     assert "first paragraph" in data["chunks"][0]
 
     # 3. Check that the original PDF was deleted
-    assert not mock_fs.exists("/app/ingestion/source_documents/pdfs/test_paper.pdf")
+    assert not (mock_fs / "ingestion/source_documents/pdfs/test_paper.pdf").exists()
 
     # 4. Check that the quarantined directory is empty
-    quarantined_files = list(mock_fs.glob("/app/ingestion/source_documents/quarantined/*"))
+    quarantined_files = list((mock_fs / "ingestion/source_documents/quarantined").glob("*"))
     assert len(quarantined_files) == 0
 
 
-@patch('ingestion.ingest_pipeline.requests.post')
+@patch('ingestion.ingest_pipeline._GROBID_SESSION.post')
 def test_ingestion_pipeline_grobid_failure(mock_post, mock_fs):
     """
     Tests the pipeline's error handling when GROBID fails.
@@ -149,18 +175,16 @@ def test_ingestion_pipeline_grobid_failure(mock_post, mock_fs):
     mock_post.return_value = mock_grobid_response
 
     # --- Run the pipeline ---
-    import importlib
-    importlib.reload(ingest_pipeline)
     ingest_pipeline.main()
 
     # --- Assertions ---
     # 1. Check that the PDF was moved to quarantine
-    quarantined_files = list(mock_fs.glob("/app/ingestion/source_documents/quarantined/*.pdf"))
+    quarantined_files = list((mock_fs / "ingestion/source_documents/quarantined").glob("*.pdf"))
     assert len(quarantined_files) == 1
     assert quarantined_files[0].name == "test_paper.pdf"
 
     # 2. Check that no processed file was created
-    processed_files = list(mock_fs.glob("/app/ingestion/processed_data/*.json"))
+    processed_files = list((mock_fs / "ingestion/processed_data").glob("*.json"))
     assert len(processed_files) == 0
 
 
@@ -169,27 +193,16 @@ def test_xml_to_markdown_conversion(mock_fs):
     Tests the convert_xml_to_md function in isolation.
     """
     # --- Setup ---
-    # Read the sample XML content from the real file system before pyfakefs takes over
-    with open("tests/test_data/sample.xml", "r") as f:
-        xml_content = f.read()
+    xml_content = SAMPLE_XML_FILE.read_bytes()
 
-    # Create the necessary files and directories in the fake file system
-    xml_path = Path("/app/test.xml")
-    md_path = Path("/app/test.md")
-    pdf_path = Path("/app/dummy.pdf") # A dummy path for the function signature
-    mock_fs.create_file(xml_path, contents=xml_content)
+    pdf_path = mock_fs / "dummy.pdf" # A dummy path for the function signature
 
     # --- Run the function ---
-    import importlib
-    importlib.reload(ingest_pipeline)
-    success = ingest_pipeline.convert_xml_to_md(xml_path, md_path, pdf_path)
+    success, markdown_content = ingest_pipeline.convert_xml_to_md(xml_content, pdf_path)
 
     # --- Assertions ---
     assert success is True
-    assert md_path.exists()
-
-    with open(md_path, 'r') as f:
-        markdown_content = f.read()
+    assert markdown_content is not None
 
     assert "# A Sample Paper for Testing" in markdown_content
     assert "## Abstract" in markdown_content
@@ -199,7 +212,7 @@ def test_xml_to_markdown_conversion(mock_fs):
     assert "|---|---|" in markdown_content
 
 
-@patch('ingestion.ingest_pipeline.requests.post')
+@patch('ingestion.ingest_pipeline._GROBID_SESSION.post')
 @patch('ingestion.ingest_pipeline.ChatOpenAI')
 def test_ingestion_pipeline_llm_failure(mock_chat_openai, mock_post, mock_fs):
     """
@@ -209,7 +222,7 @@ def test_ingestion_pipeline_llm_failure(mock_chat_openai, mock_post, mock_fs):
     # Mock the GROBID API call to succeed
     mock_grobid_response = MagicMock()
     mock_grobid_response.status_code = 200
-    mock_grobid_response.text = MOCK_XML_CONTENT
+    mock_grobid_response.content = MOCK_XML_CONTENT.encode('utf-8')
     mock_post.return_value = mock_grobid_response
 
     # Mock the LLM to raise an exception upon invocation
@@ -218,16 +231,168 @@ def test_ingestion_pipeline_llm_failure(mock_chat_openai, mock_post, mock_fs):
     mock_chat_openai.return_value = mock_llm_instance
 
     # --- Run the pipeline ---
-    import importlib
-    importlib.reload(ingest_pipeline)
     ingest_pipeline.main()
 
     # --- Assertions ---
     # 1. Check that the PDF was moved to quarantine
-    quarantined_files = list(mock_fs.glob("/app/ingestion/source_documents/quarantined/*.pdf"))
+    quarantined_files = list((mock_fs / "ingestion/source_documents/quarantined").glob("*.pdf"))
     assert len(quarantined_files) == 1
     assert quarantined_files[0].name == "test_paper.pdf"
 
     # 2. Check that no processed file was created
-    processed_files = list(mock_fs.glob("/app/ingestion/processed_data/*.json"))
+    processed_files = list((mock_fs / "ingestion/processed_data").glob("*.json"))
     assert len(processed_files) == 0
+
+
+@patch('ingestion.ingest_pipeline._GROBID_SESSION.post')
+def test_ingestion_pipeline_skips_processed_and_quarantined(mock_post, mock_fs, monkeypatch):
+    """
+    Tests that, when reprocessing is not forced, a PDF with an existing
+    processed JSON or a copy in quarantine never reaches GROBID.
+    """
+    monkeypatch.setattr(ingest_pipeline.ingest_config, "FORCE_REPROCESS_PDF", False)
+
+    # test_paper.pdf already has its output; quarantined.pdf failed before
+    pdf_dir = mock_fs / "ingestion/source_documents/pdfs"
+    (mock_fs / "ingestion/processed_data/test_paper.json").write_bytes(b"{}")
+    (pdf_dir / "quarantined.pdf").write_bytes(b"other pdf content")
+    (mock_fs / "ingestion/source_documents/quarantined/quarantined.pdf").write_bytes(b"other pdf content")
+
+    # --- Run the pipeline ---
+    ingest_pipeline.main()
+
+    # --- Assertions ---
+    mock_post.assert_not_called()
+    assert (pdf_dir / "test_paper.pdf").exists()
+    assert (pdf_dir / "quarantined.pdf").exists()
+
+
+@patch('ingestion.ingest_pipeline._GROBID_SESSION.post')
+@patch('ingestion.ingest_pipeline.ChatOpenAI')
+def test_ingestion_pipeline_skips_duplicate_content(mock_chat_openai, mock_post, mock_fs, monkeypatch):
+    """
+    Tests that a PDF whose bytes were already ingested under another name
+    is skipped when reprocessing is not forced.
+    """
+    monkeypatch.setattr(ingest_pipeline.ingest_config, "FORCE_REPROCESS_PDF", False)
+
+    # The same bytes under a second name
+    pdf_dir = mock_fs / "ingestion/source_documents/pdfs"
+    (pdf_dir / "test_paper_copy.pdf").write_bytes((pdf_dir / "test_paper.pdf").read_bytes())
+
+    mock_grobid_response = MagicMock()
+    mock_grobid_response.status_code = 200
+    mock_grobid_response.content = MOCK_XML_CONTENT.encode('utf-8')
+    mock_post.return_value = mock_grobid_response
+
+    mock_llm_instance = MockLLM()
+    mock_llm_instance.invoke = MagicMock(return_value=orjson.dumps(MOCK_LLM_RESPONSE).decode())
+    mock_chat_openai.return_value = mock_llm_instance
+
+    # --- Run the pipeline ---
+    ingest_pipeline.main()
+
+    # --- Assertions ---
+    # 1. GROBID was called once, and only one output exists
+    assert mock_post.call_count == 1
+    processed_files = list((mock_fs / "ingestion/processed_data").glob("*.json"))
+    assert len(processed_files) == 1
+
+    # 2. The content hash was recorded
+    digest = ingest_pipeline.hashlib.sha256(b"dummy pdf content").hexdigest()
+    hashes = orjson.loads((mock_fs / MOCK_INGEST_PATHS["PROCESSED_HASHES_FILE"]).read_bytes())
+    assert digest in hashes
+
+    # 3. The duplicate was skipped and left where it was
+    assert len(list(pdf_dir.glob("*.pdf"))) == 1
+
+    # --- A later run skips another copy using the recorded hash ---
+    (pdf_dir / "test_paper_again.pdf").write_bytes(b"dummy pdf content")
+    ingest_pipeline.main()
+
+    assert mock_post.call_count == 1
+    assert (pdf_dir / "test_paper_again.pdf").exists()
+
+
+@patch('ingestion.ingest_pipeline._GROBID_SESSION.post')
+@patch('ingestion.ingest_pipeline.ChatOpenAI')
+def test_ingestion_pipeline_save_failure(mock_chat_openai, mock_post, mock_fs, monkeypatch):
+    """
+    Tests that a PDF whose output can't be saved is kept and its hash is not
+    recorded, so the next run processes it again.
+    """
+    monkeypatch.setattr(ingest_pipeline.ingest_config, "FORCE_REPROCESS_PDF", False)
+    monkeypatch.setattr(ingest_pipeline, "save_processed_data", lambda path, data: False)
+
+    mock_grobid_response = MagicMock()
+    mock_grobid_response.status_code = 200
+    mock_grobid_response.content = MOCK_XML_CONTENT.encode('utf-8')
+    mock_post.return_value = mock_grobid_response
+
+    mock_llm_instance = MockLLM()
+    mock_llm_instance.invoke = MagicMock(return_value=orjson.dumps(MOCK_LLM_RESPONSE).decode())
+    mock_chat_openai.return_value = mock_llm_instance
+
+    # --- Run the pipeline ---
+    ingest_pipeline.main()
+
+    # --- Assertions ---
+    # 1. The PDF is still in the source directory, not deleted or quarantined
+    assert (mock_fs / "ingestion/source_documents/pdfs/test_paper.pdf").exists()
+    assert not list((mock_fs / "ingestion/source_documents/quarantined").glob("*"))
+
+    # 2. Its hash was not recorded
+    hashes_file = mock_fs / MOCK_INGEST_PATHS["PROCESSED_HASHES_FILE"]
+    digest = ingest_pipeline.hashlib.sha256(b"dummy pdf content").hexdigest()
+    assert not hashes_file.exists() or digest not in orjson.loads(hashes_file.read_bytes())
+
+
+def test_clean_text_strips_controls_and_collapses_whitespace():
+    """
+    Tests that control characters are dropped, whitespace controls are
+    collapsed with the surrounding spaces, and the ends are stripped.
+    """
+    assert ingest_pipeline.clean_text("  a\x00b\x1bc\x7f \t\n d\r\n\x0ce  ") == "abc d e"
+
+def test_clean_text_ascii_fast_path():
+    """
+    Tests that plain ASCII text is returned unchanged apart from whitespace.
+    """
+    assert ingest_pipeline.clean_text("Plain ASCII text.") == "Plain ASCII text."
+
+def test_clean_text_soft_hyphens_and_zero_width():
+    """
+    Tests that soft hyphens and zero-width spaces are removed, rejoining
+    the word they split.
+    """
+    assert ingest_pipeline.clean_text("hy\u00adphen\u200bated wo\ufeffrd") == "hyphenated word"
+
+def test_clean_text_unicode_spaces():
+    """
+    Tests that NBSP and other Unicode space separators become single
+    plain spaces.
+    """
+    text = "a\u00a0b\u2009c\u2003d\u3000e\u202ff \u00a0\u2009 g"
+    assert ingest_pipeline.clean_text(text) == "a b c d e f g"
+
+def test_clean_text_normalizes_to_nfc():
+    """
+    Tests that decomposed characters are composed, so identical text is
+    byte-identical.
+    """
+    assert ingest_pipeline.clean_text("Cafe\u0301 nai\u0308ve") == "Caf\u00e9 na\u00efve"
+
+
+def test_split_markdown_sections_packs_within_budget():
+    """
+    Tests that oversized Markdown is split at '## ' headers, packed greedily,
+    and that no text is lost.
+    """
+    markdown_text = "# Title\n\n## Intro\nshort\n\n## Methods\n" + "m" * 40 + "\n\n## Results\nok\n"
+
+    parts = ingest_pipeline.split_markdown_sections(markdown_text, 30)
+
+    assert len(parts) > 1
+    assert parts[0].startswith("# Title")
+    assert all(part.startswith("## ") for part in parts[1:])
+    assert "".join(parts) == markdown_text
@@ -1,67 +1,15 @@
 import pytest
-from unittest.mock import patch
-from txtai import Embeddings
+from types import SimpleNamespace
+
+import numpy as np
 
 # --- Module to be tested ---
 # This import assumes the directory has been renamed from '3_agents' to 'agents'
 from agents.tools import database_tools
 
-# --- Mock Data ---
-MOCK_DB_DATA = [
-    {
-        "id": "doc1_chunk_001",
-        "text": "The quick brown fox jumps over the lazy dog.",
-        "source_filename": "document1.pdf",
-    },
-    {
-        "id": "doc1_chunk_002",
-        "text": "A key component of the system is the central processing unit.",
-        "source_filename": "document1.pdf",
-    },
-]
-
-# --- Pytest Fixture for Test Database ---
-@pytest.fixture(scope="session", autouse=True)
-def setup_test_database(tmp_path_factory):
-    """
-    A session-scoped fixture that builds the test database once.
-    `autouse=True` means it will run automatically for the session.
-    """
-    # We need to import the setup script and run its main function
-    from tests import setup_test_db
-
-    # Temporarily change the output directory to a pytest-managed temp dir
-    # This prevents cluttering the project with a 'tests/temp_db' folder
-    temp_db_path = tmp_path_factory.mktemp("temp_db")
-
-    # Use monkeypatch to override the DB_OUTPUT_DIR in the setup script
-    with patch.object(setup_test_db, 'DB_OUTPUT_DIR', temp_db_path):
-        setup_test_db.build_test_database()
-
-    # Yield the path to the temporary database for tests to use
-    yield temp_db_path
-
-
-@pytest.fixture(scope="function")
-def patch_db_path(monkeypatch, setup_test_database):
-    """
-    A function-scoped fixture to patch the database path in the tools module.
-    This ensures each test runs with a clean patch.
-    """
-    # The path to the 'config.yml' file within the temp_db directory
-    db_config_path = setup_test_database / "config.yml"
-
-    # Patch the DATABASE_PATH in the main_config module, which database_tools reads
-    # This assumes that database_tools uses main_config.DATABASE_PATH to find the DB
-    # A cleaner way would be to patch database_tools._load_database directly.
-    # Let's patch the loaded object instead, which is more robust.
-
-    # Load the temporary embeddings
-    temp_embeddings = Embeddings()
-    temp_embeddings.load(str(setup_test_database))
-
-    # Patch the global embeddings object in the tools module
-    monkeypatch.setattr(database_tools, "embeddings", temp_embeddings)
+# --- Fixtures ---
+# The test database fixtures (`setup_test_database`, `mock_db_embeddings` and
+# `patch_db_path`) are shared with the other test modules via conftest.py.
 
 
 # --- Tests for query_database ---
@@ -77,11 +25,13 @@ def test_query_database_success(patch_db_path):
     assert "sample_doc_chunk_001" in result
     assert "sample markdown document" in result
 
-def test_query_database_no_results(patch_db_path):
+def test_query_database_no_results(patch_db_path, mock_db_embeddings, monkeypatch):
     """
     Tests the query_database function when no relevant results are found.
+    A similarity search always returns the nearest chunks of a non-empty
+    index, so the search itself is patched to find nothing.
     """
-    monkeypatch.setattr(database_tools, "embeddings", mock_db_embeddings)
+    monkeypatch.setattr(mock_db_embeddings, "search", lambda *args, **kwargs: [])
 
     query = "financial markets"
     result = database_tools.query_database(query)
@@ -99,6 +49,29 @@ def test_query_database_unavailable(monkeypatch):
 
     assert result == "Database is not available. Please ensure it has been built correctly."
 
+# --- Tests for query_database_batch ---
+
+def test_query_database_batch_success(patch_db_path):
+    """
+    Tests that the batch tool returns a section of results per query.
+    """
+    queries = '["vector database", "predictable data source"]'
+    result = database_tools.query_database_batch(queries)
+
+    assert "=== Query: vector database ===" in result
+    assert "=== Query: predictable data source ===" in result
+    assert result.count("sample_doc_chunk_001") == 2
+
+def test_query_database_batch_unavailable(monkeypatch):
+    """
+    Tests the batch tool when the database is not loaded.
+    """
+    monkeypatch.setattr(database_tools, "embeddings", None)
+
+    result = database_tools.query_database_batch(["anything"])
+
+    assert result == "Database is not available. Please ensure it has been built correctly."
+
 # --- Tests for get_chunk_by_id ---
 
 def test_get_chunk_by_id_success(patch_db_path):
@@ -131,3 +104,311 @@ def test_get_chunk_by_id_unavailable(monkeypatch):
     result = database_tools.get_chunk_by_id(chunk_id)
 
     assert result == "Database is not available. Please ensure it has been built correctly."
+
+# --- Tests for get_chunks_by_ids ---
+
+def test_get_chunks_by_ids_success(patch_db_path):
+    """
+    Tests that found and missing IDs are both resolved in one call.
+    """
+    result = database_tools.get_chunks_by_ids(["sample_doc_chunk_001", "non_existent_id"])
+
+    assert set(result) == {"sample_doc_chunk_001", "non_existent_id"}
+    assert "predictable data source" in result["sample_doc_chunk_001"]
+    assert result["non_existent_id"] == "The specified chunk ID 'non_existent_id' does not exist in the database."
+
+def test_get_chunks_by_ids_unavailable(monkeypatch):
+    """
+    Tests the get_chunks_by_ids function when the database is not loaded.
+    """
+    monkeypatch.setattr(database_tools, "embeddings", None)
+
+    result = database_tools.get_chunks_by_ids(["doc1_chunk_001"])
+
+    assert result == {"doc1_chunk_001": "Database is not available. Please ensure it has been built correctly."}
+
+# --- Tests for get_embeddings ---
+
+def test_get_embeddings_loads_once(monkeypatch):
+    """
+    Tests that the database is loaded on first use and then reused.
+    """
+    loads = []
+
+    def fake_load():
+        loads.append(1)
+        database_tools.embeddings = "loaded-index"
+
+    monkeypatch.setattr(database_tools, "embeddings", database_tools._NOT_LOADED)
+    monkeypatch.setattr(database_tools, "_load_database", fake_load)
+
+    assert database_tools.get_embeddings() == "loaded-index"
+    assert database_tools.get_embeddings() == "loaded-index"
+    assert len(loads) == 1
+
+# --- Tests for HNSW Search ---
+
+def test_configure_hnsw_search_sets_efsearch(monkeypatch):
+    """
+    Tests that ANN_EF_SEARCH reaches the HNSW backend's 'efsearch' setting
+    and is applied to the hnswlib index on search.
+    """
+    pytest.importorskip("hnswlib")
+    from txtai.ann import HNSW
+
+    monkeypatch.setattr(database_tools.main_config, "ANN_EF_SEARCH", 77)
+    rng = np.random.default_rng(0)
+    vectors = _random_unit_vectors(rng, 50, 16)
+
+    # txtai hands the index's config dict to its ANN, so both see the change
+    config = {"backend": "hnsw", "dimensions": 16, "hnsw": {"m": 8}}
+    index = SimpleNamespace(config=config, ann=HNSW(config))
+    index.ann.index(vectors)
+
+    database_tools._configure_hnsw_search(index)
+
+    assert index.ann.setting("efsearch") == 77
+    assert index.ann.setting("m") == 8
+    index.ann.search(vectors[:1], 5)
+    assert index.ann.backend.ef == 77
+
+
+# --- Tests for Quantized Search ---
+
+requires_simsimd = pytest.mark.skipif(database_tools.simsimd is None, reason="simsimd is not installed")
+
+def _random_unit_vectors(rng, count, dimensions):
+    """
+    Returns float32 rows normalized to unit length, like txtai's vectors.
+    """
+    vectors = rng.standard_normal((count, dimensions)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def _numpy_index(vectors):
+    """
+    Wraps a txtai NumPy ANN over the given vectors in an index-like object.
+    """
+    ann = database_tools.NumPy({})
+    ann.index(vectors.copy())
+    return SimpleNamespace(ann=ann)
+
+@pytest.fixture
+def quantized_data():
+    """
+    A small random index and queries that sit near known rows, so each
+    query's exact nearest neighbour is the row it was derived from.
+    """
+    rng = np.random.default_rng(0)
+    vectors = _random_unit_vectors(rng, 200, 256)
+    queries = vectors[:5] + _random_unit_vectors(rng, 5, 256) / 32
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    return vectors, queries
+
+def test_quantize_i8_scales_rows():
+    """
+    Tests that each row is scaled to the int8 range by its own peak, and
+    that all-zero (deleted) rows stay zero.
+    """
+    vectors = np.array([[0.5, -0.25, 0.0], [0.0, 0.0, 0.0], [-2.0, 1.0, 0.5]], dtype=np.float32)
+
+    codes = database_tools._quantize_i8(vectors)
+
+    assert codes.dtype == np.int8
+    assert codes.tolist() == [[127, -64, 0], [0, 0, 0], [-127, 64, 32]]
+
+def test_quantize_b1_packs_signs():
+    """
+    Tests that positive dimensions set bits, packed eight per byte.
+    """
+    vectors = np.array([[1, -1, 1, -1, 0, 1, 1, 1, -1, 1]], dtype=np.float32)
+
+    codes = database_tools._quantize_b1(vectors)
+
+    assert codes.dtype == np.uint8
+    assert codes.tolist() == [[0b10100111, 0b01000000]]
+
+def _bf16_to_float32(codes):
+    """
+    Expands bfloat16 codes back to float32 by restoring the low 16 bits.
+    """
+    return (codes.astype(np.uint32) << 16).view(np.float32)
+
+def test_quantize_bf16_rounds_to_nearest_even():
+    """
+    Tests bfloat16 rounding on exact values, ties, signed zeros, infinities,
+    and the largest float32, which rounds up to infinity.
+    """
+    cases = [
+        (1.0, 0x3F80),
+        (-2.0, 0xC000),
+        (0.0, 0x0000),
+        (-0.0, 0x8000),
+        (1 + 2**-8, 0x3F80),            # Tie, rounds down to the even code
+        (1 + 3 * 2**-8, 0x3F82),        # Tie, rounds up to the even code
+        (1 + 2**-8 + 2**-20, 0x3F81),   # Just above the tie
+        (-(1 + 3 * 2**-8), 0xBF82),
+        (np.inf, 0x7F80),
+        (-np.inf, 0xFF80),
+        (float(np.finfo(np.float32).max), 0x7F80),
+    ]
+    vectors = np.array([[value for value, _ in cases]], dtype=np.float32)
+
+    codes = database_tools._quantize_bf16(vectors)
+
+    assert codes.dtype == np.uint16
+    assert codes[0].tolist() == [code for _, code in cases]
+
+def test_quantize_bf16_keeps_nan():
+    """
+    Tests that NaNs, including payloads that rounding would carry into
+    Inf or wrap to zero, stay NaN.
+    """
+    nans = np.array([[0x7FC00000, 0x7F800001, 0xFFFFFFFF, 0xFF80FFFF]], dtype=np.uint32).view(np.float32)
+
+    codes = database_tools._quantize_bf16(nans)
+
+    assert np.isnan(_bf16_to_float32(codes)).all()
+
+def test_quantize_bf16_error_bound():
+    """
+    Tests that positive and negative values of many magnitudes come back
+    within half a bfloat16 step (8 significant bits).
+    """
+    rng = np.random.default_rng(0)
+    vectors = (rng.standard_normal((16, 64)) * 10.0 ** rng.integers(-20, 20, (16, 64))).astype(np.float32)
+
+    restored = _bf16_to_float32(database_tools._quantize_bf16(vectors))
+
+    assert (np.sign(restored) == np.sign(vectors)).all()
+    assert (np.abs(restored - vectors) <= np.abs(vectors) * 2.0**-8).all()
+
+def test_quantize_f16_edge_values():
+    """
+    Tests half precision on negatives, overflow, infinities and NaN.
+    """
+    vectors = np.array([[-0.5, 1e5, -1e5, np.inf, -np.inf, np.nan, -65504.0]], dtype=np.float32)
+
+    with np.errstate(over="ignore"):
+        codes = database_tools._quantize_f16(vectors)
+
+    assert codes.dtype == np.float16
+    assert codes[0, 0] == -0.5
+    assert codes[0, 1] == np.inf and codes[0, 2] == -np.inf
+    assert codes[0, 3] == np.inf and codes[0, 4] == -np.inf
+    assert np.isnan(codes[0, 5])
+    assert codes[0, 6] == -65504.0
+
+@requires_simsimd
+@pytest.mark.parametrize("dtype,min_recall", [("fp16", 0.9), ("bf16", 0.9), ("i8", 0.9), ("b1", 0.5)])
+def test_quantized_search_recall(quantized_data, monkeypatch, dtype, min_recall):
+    """
+    Tests each quantized mode against an exact float32 search: the nearest
+    neighbour is always found, most of the top-k is recovered, and the
+    returned scores are the exact float32 scores.
+    """
+    vectors, queries = quantized_data
+    limit = 5
+    monkeypatch.setattr(database_tools.main_config, "QUANT_DTYPE", dtype)
+    monkeypatch.setattr(database_tools.main_config, "QUANT_RERANK_FACTOR", 4)
+    index = _numpy_index(vectors)
+    database_tools._install_quantized_search(index)
+
+    results = index.ann.search(queries, limit)
+
+    exact = np.argsort(-np.dot(queries, vectors.T), axis=1)[:, :limit]
+    assert len(results) == len(queries)
+    recall = np.mean([len({uid for uid, _ in result} & set(top)) / limit for result, top in zip(results, exact)])
+    assert recall >= min_recall
+    for query, result, top in zip(queries, results, exact):
+        assert result[0][0] == top[0]
+        ids, scores = zip(*result)
+        np.testing.assert_allclose(scores, vectors[list(ids)] @ query, rtol=1e-5)
+
+@requires_simsimd
+def test_quantized_search_shortlist_covers_index(quantized_data, monkeypatch):
+    """
+    Tests that when the shortlist would be at least the whole index, every
+    row is re-ranked, so the results match the exact search.
+    """
+    vectors, queries = quantized_data
+    vectors = vectors[:12]
+    monkeypatch.setattr(database_tools.main_config, "QUANT_DTYPE", "b1")
+    monkeypatch.setattr(database_tools.main_config, "QUANT_RERANK_FACTOR", 4)
+    index = _numpy_index(vectors)
+    database_tools._install_quantized_search(index)
+
+    results = index.ann.search(queries, 3)
+
+    exact = np.argsort(-np.dot(queries, vectors.T), axis=1)[:, :3]
+    assert [[uid for uid, _ in result] for result in results] == exact.tolist()
+
+@requires_simsimd
+def test_quantized_search_single_query(quantized_data, monkeypatch):
+    """
+    Tests a batch of one query, the shape txtai passes for a single search.
+    """
+    vectors, queries = quantized_data
+    monkeypatch.setattr(database_tools.main_config, "QUANT_DTYPE", "i8")
+    index = _numpy_index(vectors)
+    database_tools._install_quantized_search(index)
+
+    results = index.ann.search(queries[:1], 3)
+
+    assert len(results) == 1
+    assert len(results[0]) == 3
+    assert results[0][0][0] == 0
+
+# --- Tests for SIMD Scoring ---
+
+@requires_simsimd
+def test_simd_scoring_matches_numpy(quantized_data):
+    """
+    Tests that a NumPy index scored through simsimd returns the same
+    neighbours, and scores within float32 tolerance, as txtai's np.dot.
+    """
+    vectors, queries = quantized_data
+    index = _numpy_index(vectors)
+    expected = index.ann.search(queries, 5)
+
+    database_tools._install_simd_scoring(index)
+    assert index.ann.dot is database_tools._simd_dot
+
+    results = index.ann.search(queries, 5)
+    np.testing.assert_allclose(
+        database_tools._simd_dot(queries, index.ann.backend.T), np.dot(queries, vectors.T), rtol=1e-5, atol=1e-6
+    )
+    for result, exact in zip(results, expected):
+        assert [uid for uid, _ in result] == [uid for uid, _ in exact]
+        np.testing.assert_allclose([score for _, score in result], [score for _, score in exact], rtol=1e-5)
+
+@requires_simsimd
+def test_simd_scoring_skipped_on_other_txtai_versions(quantized_data, monkeypatch):
+    """
+    Tests that the private scoring hook is left alone on an untested txtai
+    major version.
+    """
+    vectors, _ = quantized_data
+    monkeypatch.setattr(database_tools, "TXTAI_VERSION", "99.0.0")
+    index = _numpy_index(vectors)
+
+    database_tools._install_simd_scoring(index)
+
+    assert index.ann.dot is np.dot
+
+# --- Integration Test with a Real Index ---
+
+def test_query_database_real_index(setup_test_database, monkeypatch):
+    """
+    Tests the query tools against a real txtai index built from the sample
+    document, to check the SQL they issue against txtai itself rather than
+    the fake used by the other tests.
+    """
+    assert setup_test_database is not None, "The test database failed to build."
+    monkeypatch.setattr(database_tools, "embeddings", setup_test_database)
+
+    result = database_tools.query_database("vector database")
+    assert "Found 1 relevant chunks" in result
+    assert "Source: sample_doc.md" in result
+
+    result = database_tools.get_chunk_by_id("sample_doc_chunk_001")
+    assert "predictable data source" in result